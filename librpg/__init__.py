@@ -3,7 +3,8 @@ import pygame
 from librpg import (virtualscreen, config, party, map, world, mapobject,
                     camera, image, loader, item, util, context, maparea,
                     tile, dialog, mapview, menu, movement, state, sound, quest,
-                    path, animation)
+                    path, animation, layercache, profiling, replay, batch,
+                    mapfile)
 
 
 def init(game_name='LibRPG Game', icon=None):
@@ -19,5 +20,8 @@ def init(game_name='LibRPG Game', icon=None):
     virtualscreen.init(config.graphics_config.real_screen_dimensions,
                        config.graphics_config.display_mode,
                        config.graphics_config.screen_dimensions,
-                       config.graphics_config.scale)
+                       config.graphics_config.scale,
+                       config.graphics_config.dirty_rects,
+                       config.graphics_config.prescale,
+                       config.graphics_config.display_depth)
     pygame.display.set_caption(game_name)
@@ -6,6 +6,7 @@ or applications.
 
 
 from librpg.image import Image
+from librpg.virtualscreen import prescale
 
 
 class Metronome(object):
@@ -43,6 +44,9 @@ class AnimatedImage(Image):
     *frame_duration* should be an integer indicating the number of frames
     for which each Surface will be displayed before switching to the next.
 
+    *static* should be True only if the Surfaces will never be changed,
+    so that scaled copies of them are kept, as in Image.
+
     Note that::
 
         AnimatedImage([a, b, c])
@@ -52,9 +56,12 @@ class AnimatedImage(Image):
         AnimatedImage([a, a, b, b, c, c], 2)
     """
 
-    def __init__(self, surfaces, frame_duration=1):
+    def __init__(self, surfaces, frame_duration=1, static=False):
         assert surfaces, 'First paramater has to be a list of Surfaces'
         self.surfaces = surfaces
+        if static:
+            for surface in surfaces:
+                prescale(surface, lazy=True)
 
         self.frames = len(self.surfaces)
         self.frame_duration = frame_duration
@@ -0,0 +1,217 @@
+"""
+The :mod:`batch` module runs many headless World simulations in
+parallel, one per process of a multiprocessing pool, to soak-test maps
+and quests with every core available.
+
+Each run is described by a BatchJob, which names a function creating
+the World to simulate. Since jobs are sent to other processes, that
+function and any other callable in the job must be defined at the top
+level of a module. The results come back as BatchResults.
+
+The multiprocessing module is required, which comes with Python 2.6 and
+later.
+"""
+
+import os
+import sys
+import random
+import pickle
+import traceback
+
+VIDEO_DRIVER = 'dummy'
+
+
+class BatchJob(object):
+
+    """
+    A BatchJob describes one simulation run.
+
+    *factory* should be a function that, called with *args*, returns a
+    World or MicroWorld with its initial or loaded state set, ready for
+    gameloop(). It is called after librpg.init(), so it may configure
+    librpg as usual.
+
+    *ticks* and *until* limit the simulation as in World.simulate().
+
+    *input_file* is an input recording to feed to the game and
+    *input_events* a list of (frame, event) tuples to feed instead, as
+    taken by ScriptedInput. Without either, the game receives no input.
+
+    *check*, if given, is called with the World after the simulation.
+    Its return value is stored in the BatchResult, and any exception it
+    raises, such as a failed assertion, marks the run as failed.
+
+    The random module is seeded with *seed* before the World is created.
+    *name* identifies the run in the results.
+    """
+
+    def __init__(self, factory, args=(), ticks=None, until=None,
+                 input_file=None, input_events=None, check=None, seed=0,
+                 name=None):
+        self.factory = factory
+        self.args = args
+        self.ticks = ticks
+        self.until = until
+        self.input_file = input_file
+        self.input_events = input_events
+        self.check = check
+        self.seed = seed
+        if name is None:
+            name = '%s(%s)' % (factory.__name__,
+                               ', '.join([repr(arg) for arg in args]))
+        self.name = name
+
+
+class BatchResult(object):
+
+    """
+    A BatchResult holds the outcome of a BatchJob.
+
+    :attr:`name`
+        Name of the BatchJob.
+
+    :attr:`ok`
+        Whether the run finished without exceptions, including the ones
+        raised by the job's check.
+
+    :attr:`error`
+        Traceback of the exception that failed the run, or None.
+
+    :attr:`ticks`
+        How many ticks were simulated.
+
+    :attr:`elapsed`
+        How many seconds the simulation took.
+
+    :attr:`check_result`
+        Return value of the job's check, or None.
+
+    :attr:`state`
+        The World's State locals after the simulation, or None if they
+        could not be pickled.
+
+    :attr:`pid`
+        Id of the process that ran the job.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.ok = False
+        self.error = None
+        self.ticks = 0
+        self.elapsed = 0.0
+        self.check_result = None
+        self.state = None
+        self.pid = os.getpid()
+
+    def get_rate(self):
+        """
+        Return how many ticks per second were simulated.
+        """
+        return self.ticks / max(self.elapsed, 1e-6)
+
+
+def init_worker():
+    """
+    Initialize librpg with a dummy display in a worker process.
+    """
+    os.environ['SDL_VIDEODRIVER'] = VIDEO_DRIVER
+    import librpg
+    from librpg.config import graphics_config
+    # The dummy display would pick a format unlike the Surfaces'
+    graphics_config.display_depth = 32
+    librpg.init()
+
+
+def reset_worker():
+    # Leave nothing behind from a previous job run in the same process
+    from librpg.context import get_context_stack
+    from librpg.input import Input
+    context_stack = get_context_stack()
+    for context in list(context_stack.stack):
+        context_stack.remove_context(context)
+    context_stack.input_source = None
+    context_stack.simulation = None
+    Input.events.clear()
+    Input.pressed.clear()
+
+
+def run_job(job):
+    """
+    Run *job* in the current process, which should have been set up by
+    init_worker(), and return its BatchResult.
+    """
+    from librpg.replay import InputReplay, ScriptedInput, set_input_source
+
+    result = BatchResult(job.name)
+    simulation = None
+    world = None
+    try:
+        reset_worker()
+        random.seed(job.seed)
+        if job.input_file is not None:
+            set_input_source(InputReplay(job.input_file))
+        else:
+            set_input_source(ScriptedInput(job.input_events or []))
+
+        world = job.factory(*job.args)
+        simulation = world.simulate(job.ticks, job.until)
+        if job.check is not None:
+            result.check_result = job.check(world)
+        result.ok = True
+    except (Exception, SystemExit):
+        result.error = ''.join(traceback.format_exception(*sys.exc_info()))
+
+    if simulation is not None:
+        result.ticks = simulation.ticks_run
+        result.elapsed = simulation.get_elapsed()
+    if world is not None and getattr(world, 'state', None) is not None:
+        try:
+            pickle.dumps(world.state.locals, 2)
+            result.state = world.state.locals
+        except Exception:
+            result.state = None
+    return result
+
+
+def run_batch(jobs, processes=None, isolate=True, callback=None):
+    """
+    Run *jobs*, a list of BatchJobs, in a pool of *processes* worker
+    processes, by default one per core, and return their BatchResults
+    in the same order.
+
+    If *isolate* is True, each job runs in a new process, so that no
+    global state leaks between them. Otherwise processes are reused,
+    which saves starting and initializing them.
+
+    *callback*, if given, is called in this process with each
+    BatchResult as soon as it arrives.
+    """
+    import multiprocessing
+
+    if isolate:
+        pool = multiprocessing.Pool(processes, init_worker,
+                                    maxtasksperchild=1)
+    else:
+        pool = multiprocessing.Pool(processes, init_worker)
+
+    results = [None] * len(jobs)
+    try:
+        indexed = pool.imap_unordered(run_indexed_job,
+                                      list(enumerate(jobs)))
+        for index, result in indexed:
+            results[index] = result
+            if callback is not None:
+                callback(result)
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return results
+
+
+def run_indexed_job(indexed_job):
+    index, job = indexed_job
+    return index, run_job(job)
@@ -14,6 +14,8 @@ class CommandContext(Context):
     False otherwise.
     """
 
+    reports_dirty_rects = True
+
     def __init__(self, mapping, parent=None):
         Context.__init__(self, parent)
         self.mapping = mapping
@@ -45,7 +45,7 @@ class ClassicMenuTheme(MenuTheme):
                                  (rect.width - 2 * self.border,
                                   rect.height - self.border))
         pygame.draw.rect(surface, self.color, inner_rect)
-        return Image(surface)
+        return Image(surface, static=True)
 
     def draw_unselected_tab(self, rect):
         surface = pygame.Surface((rect.width, rect.height), SRCALPHA, 32)
@@ -56,7 +56,7 @@ class ClassicMenuTheme(MenuTheme):
                                  (rect.width - 2 * self.border,
                                   rect.height - self.border))
         pygame.draw.rect(surface, self.unselected_tab_color, inner_rect)
-        return Image(surface)
+        return Image(surface, static=True)
 
     def draw_bar(self, rect, filled=1.0):
         surface = pygame.Surface((rect.width, rect.height), SRCALPHA, 32)
@@ -81,7 +81,7 @@ class ClassicMenuTheme(MenuTheme):
                              (rect.left + i + border,
                               rect.bottom - 1 - border),
                              1)
-        return Image(surface)
+        return Image(surface, static=True)
 
     def draw_rounded_rect(self, surface, rect, color, round_corners,
                           border_flags=(None, True, True, True, True)):
@@ -162,7 +162,7 @@ class ClassicMenuTheme(MenuTheme):
     def draw_round_border_rect_image(self, rect,
                                border_flags=(None, True, True, True, True)):
         surface = self.draw_round_border_rect(rect, border_flags)
-        return Image(surface)
+        return Image(surface, static=True)
 
     def draw_scroll_bar(self, height, start, end, total):
         width = 12
@@ -101,9 +101,50 @@ class GraphicsConfig(Config):
     :attr:`real_screen_dimensions`
         2-Tuple with height and width of the actual screen. Read-only.
 
+    :attr:`display_depth`
+        Bits per pixel of the display. If 0, the best depth available is
+        used.
+
     :attr:`animation_frame_period`
         Number of frames after which the next frame of tile animation will
         be displayed.
+
+    :attr:`background_chunk_size`
+        Side, in tiles, of the square chunks in which the map background
+        is split. Chunks are only rendered when they first enter the
+        screen. If None, the whole background is rendered when the map is
+        loaded.
+
+    :attr:`background_cache_size`
+        Maximum memory, in bytes, that rendered background chunks may take
+        when *background_chunk_size* is set. The least recently drawn
+        chunks are discarded when it is exceeded.
+
+    :attr:`map_cache_dir`
+        Directory where the composed map layers are stored, so that maps
+        can be loaded without composing them again. If None, layers are
+        not cached.
+
+    :attr:`threaded_map_loading`
+        If True, the map layers are composed in a separate thread, starting
+        around the party, so loading a map does not freeze the game. The
+        map is shown and updated once the area around the party is ready.
+
+    :attr:`dirty_rects`
+        If True, each frame only the screen regions that the Contexts
+        report as changed will be scaled and sent to the display, instead
+        of the whole screen.
+
+    :attr:`prescale`
+        If True and *scale* is an integer, images are scaled once when
+        they are loaded and everything is drawn directly onto the
+        display, instead of scaling the whole screen every frame. Each
+        blit then covers *scale* squared times more pixels, so this pays
+        off when little of the screen is redrawn every frame or when the
+        display is hardware accelerated. It also takes *scale* squared
+        times more memory for the map layers and tiles. Contexts should
+        only draw with the screen's blit() and fill() methods in this
+        mode.
     """
 
     _screen_width = 400
@@ -112,11 +153,18 @@ class GraphicsConfig(Config):
     _object_height = 32
     _object_width = 24
     _scale = 2
+    _dirty_rects = False
+    _prescale = False
     item_icon_width = 32
     item_icon_height = 32
     camera_mode = None
     display_mode = 0
+    display_depth = 0
     animation_frame_period = 15
+    background_chunk_size = None
+    background_cache_size = 32 * 1024 * 1024
+    map_cache_dir = None
+    threaded_map_loading = False
     # display_mode = pygame.HWSURFACE | pygame.DOUBLEBUF | pygame.FULLSCREEN
 
     def __init__(self):
@@ -183,6 +231,27 @@ class GraphicsConfig(Config):
 
     scale = property(get_scale, set_scale)
 
+    def get_dirty_rects(self):
+        return self._dirty_rects
+
+    def set_dirty_rects(self, new_value):
+        self._dirty_rects = new_value
+        screen = virtualscreen.get_screen()
+        if screen is not None:
+            screen.dirty_rects = new_value
+            screen.mark_all_dirty()
+
+    dirty_rects = property(get_dirty_rects, set_dirty_rects)
+
+    def get_prescale(self):
+        return self._prescale
+
+    def set_prescale(self, new_value):
+        self._prescale = new_value
+        self.recreate_screeens()
+
+    prescale = property(get_prescale, set_prescale)
+
     def get_real_screen_dimensions(self):
         return (int(self.screen_dimensions[0] * self.scale),
                 int(self.screen_dimensions[1] * self.scale))
@@ -205,7 +274,10 @@ class GraphicsConfig(Config):
                                                    self.real_screen_dimensions,
                                                    self.display_mode,
                                                    self.screen_dimensions,
-                                                   self.scale)
+                                                   self.scale,
+                                                   self.dirty_rects,
+                                                   self.prescale,
+                                                   self.display_depth)
 
 
 class DialogConfig(Config):
@@ -264,6 +336,17 @@ class GameConfig(Config):
     :attr:`fps`
         How many frames per second the map will run (at most).
 
+    :attr:`fixed_timestep`
+        Whether the contexts are updated game_config.fps times per
+        second of real time even if drawing is slower than that, by
+        skipping draws. If False, the game slows down along with the
+        frame rate.
+
+    :attr:`max_frame_skip`
+        With fixed_timestep, the maximum number of extra updates run
+        between two draws to catch up. When the game falls further
+        behind, it slows down.
+
     :attr:`key_up`
         Set of keys that move the party up.
 
@@ -287,6 +370,8 @@ class GameConfig(Config):
     """
 
     fps = 30
+    fixed_timestep = False
+    max_frame_skip = 5
     key_up = set([K_UP])
     key_down = set([K_DOWN])
     key_left = set([K_LEFT])
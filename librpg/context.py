@@ -8,6 +8,8 @@ defines a global ContextStack, accessible through the method
 context.get_context_stack().
 """
 
+from timeit import default_timer
+
 import pygame
 
 from librpg.config import game_config
@@ -29,10 +31,43 @@ class ContextStack(object):
     :attr:`stack`
     List representing the Context stack. Do not modify it directly.
     Instead use the insert_context() and remove_context() methods.
+
+    :attr:`contexts`
+    Dict mapping the id() of each stacked Context to it, to check
+    whether a Context is stacked without searching the stack.
+
+    :attr:`children`
+    Dict mapping the id() of Contexts to the list of stacked Contexts
+    that have them as parent, in the order they were stacked.
+
+    :attr:`profiler`
+    ContextProfiler that receives the timings of each part of the
+    gameloop, or None if they are not measured. Set it through
+    profiling.enable_profiling() and profiling.disable_profiling().
+
+    :attr:`recorder`
+    FrameRecorder that receives a record of each cycle of the gameloop,
+    or None if they are not recorded. Set it through
+    profiling.enable_recording() and profiling.disable_recording().
+
+    :attr:`input_source`
+    Object whose get_input() method returns the mouse buttons, the mouse
+    position and the pygame events of each cycle, or None to read them
+    from pygame. Set it through replay.set_input_source().
+
+    :attr:`simulation`
+    Simulation being run, or None if the gameloop runs normally. Set it
+    through start_simulation() and stop_simulation().
     """
 
     def __init__(self):
         self.stack = []
+        self.contexts = {}
+        self.children = {}
+        self.profiler = None
+        self.recorder = None
+        self.input_source = None
+        self.simulation = None
 
     def stack_context(self, context):
         """
@@ -46,6 +81,12 @@ class ContextStack(object):
         self.stack.append(context)
         self.__inserted_context(context)
 
+    def contains(self, context):
+        """
+        Return whether *context* is in the stack.
+        """
+        return id(context) in self.contexts
+
     def insert_context(self, context, index):
         """
         *context* is inserted at the given *index*, pushing the ones above
@@ -65,11 +106,30 @@ class ContextStack(object):
         as its child to be destroyed.
         """
         #print 'remove_context(%s)' % context
-        try:
-            self.stack.remove(context)
-        except ValueError:
+        if id(context) not in self.contexts:
             return None
-        self.__destroyed_context(context)
+
+        # Take the whole subtree out of the stack before destroying it,
+        # each parent before its children
+        subtree = []
+        pending = [context]
+        while pending:
+            removed = pending.pop()
+            subtree.append(removed)
+            del self.contexts[id(removed)]
+            children = self.children.pop(id(removed), [])
+            children.reverse()
+            pending.extend(children)
+        self.__unlink_from_parent(context)
+
+        if len(subtree) == 1:
+            self.stack.remove(context)
+        else:
+            contexts = self.contexts
+            self.stack[:] = [c for c in self.stack if id(c) in contexts]
+
+        for removed in subtree:
+            self.__destroyed_context(removed)
         return context
 
     def stop(self):
@@ -79,14 +139,55 @@ class ContextStack(object):
         """
         self.keep_going = False
 
+    def start_simulation(self, ticks=None, until=None):
+        """
+        Make the gameloop run its Contexts' updates as fast as possible,
+        without drawing, flipping or capping the FPS, until *ticks*
+        updates were run or the *until* callable returns True, and
+        return the Simulation that keeps track of it.
+
+        The gameloop stops once the Simulation is over, as do the ones
+        started afterwards. Maps started during a simulation do not
+        compose their layers.
+        """
+        self.simulation = Simulation(ticks, until)
+        return self.simulation
+
+    def stop_simulation(self):
+        """
+        Make the gameloop run normally again and return the Simulation
+        that was being run, or None if there was none.
+        """
+        simulation = self.simulation
+        self.simulation = None
+        if simulation is not None:
+            simulation.finish()
+        return simulation
+
     def __inserted_context(self, context):
+        self.contexts[id(context)] = context
+        if context.parent is not None:
+            self.children.setdefault(id(context.parent), []).append(context)
         context.initialize()
+        self.__invalidate_screen()
+
+    def __unlink_from_parent(self, context):
+        if context.parent is None:
+            return
+        siblings = self.children.get(id(context.parent))
+        if siblings is not None:
+            siblings.remove(context)
+            if not siblings:
+                del self.children[id(context.parent)]
 
     def __destroyed_context(self, context):
         context.destroy()
-        for possible_child in self.stack:
-            if possible_child.parent is context:
-                self.remove_context(possible_child)
+        self.__invalidate_screen()
+
+    def __invalidate_screen(self):
+        screen = get_screen()
+        if screen is not None:
+            screen.mark_all_dirty()
 
     def gameloop(self, current=None):
         """
@@ -112,46 +213,239 @@ class ContextStack(object):
                      do 3.
         4) If anyone called ContextStack.stop() or if there are no
            Contexts in the stack, stop.
+
+        If game_config.fixed_timestep is set, the updates in 1) and the
+        event handling in 3) are run once for every 1/game_config.fps
+        seconds of real time that passed, so that the game keeps its
+        speed when drawing and flipping cannot keep up. Up to
+        game_config.max_frame_skip extra updates are run in a cycle to
+        catch up, skipping the draw() calls and the flips in between.
+
+        During a simulation started with start_simulation(), only 1)a)
+        and 3) happen, without capping the FPS.
         """
         #print 'gameloop(%s)' % current
         self.keep_going = True
         self.clock = pygame.time.Clock()
+        step = 1000.0 / game_config.fps
+        lag = 0
+        simulation = self.simulation
         while self.stack and self.keep_going:
-            # Limit FPS
-            self.clock.tick(game_config.fps)
-            get_metronome().step()
+            if simulation is not None:
+                if simulation.done:
+                    break
+                elapsed = 0
+            else:
+                # Limit FPS
+                elapsed = self.clock.tick(game_config.fps)
+
+            # Input is cleared after each update if there may be several
+            # per cycle, or after drawing otherwise
+            fixed_timestep = game_config.fixed_timestep and simulation is None
+            input_per_update = fixed_timestep or simulation is not None
+            if fixed_timestep:
+                lag += elapsed
+                updates = max(1, int(lag / step))
+                max_updates = 1 + game_config.max_frame_skip
+                if updates > max_updates:
+                    # Too far behind, let the game slow down
+                    updates = max_updates
+                    lag = 0
+                else:
+                    # Carry what is left, or was run ahead of time, over
+                    # to the next cycle
+                    lag -= updates * step
+            else:
+                updates = 1
+
+            profiler = self.profiler
+            recorder = self.recorder
+            if profiler is not None or recorder is not None:
+                start = default_timer()
+
+            updated = 0
+            for i in xrange(updates):
+                updated += self.__update_contexts(current, profiler)
+                if input_per_update:
+                    self.__finish_input(profiler)
+                if current is not None and not self.contains(current):
+                    self.keep_going = False
+                if simulation is not None and simulation.step():
+                    self.keep_going = False
+                if not self.stack or not self.keep_going:
+                    break
+
+            if simulation is not None:
+                drawn = 0
+            else:
+                drawn = len(self.stack)
+                self.__draw_contexts(profiler)
+            if not input_per_update:
+                self.__finish_input(profiler)
+            if simulation is None:
+                self.__flip(profiler)
+
+            if profiler is not None or recorder is not None:
+                busy = default_timer() - start
+                if profiler is not None:
+                    profiler.record('frame', busy)
+                if recorder is not None:
+                    recorder.record(start, elapsed / 1000.0, busy, updated,
+                                    drawn, self.get_map_id())
+#        print 'gameloop ended'
+        self.keep_going = True
 
-            Input.update_mouse(pygame.mouse.get_pressed(), pygame.mouse.get_pos())
+    def __update_contexts(self, current, profiler):
+        # With a profiler, reading the input and each update() are timed
+        # as well
+        get_metronome().step()
+
+        if profiler is not None:
+            start = default_timer()
+        self.__read_input()
+        if profiler is not None:
+            self.__input_time = default_timer() - start
+
+        if current is not None:
+            updated = self.__update_current(current, profiler)
+        else:
+            # Update contexts in reverse order
+            stop = False
+            updated = 0
+            for context in reversed(self.stack):
+                if context.active:
+                    #print 'updating %s' % context
+                    if context.update_interval == 1 and not context.sleeping:
+                        if profiler is None:
+                            stop = context.update()
+                        else:
+                            stop = self.__profile_update(context, profiler)
+                        updated += 1
+                    elif self.__is_due(context):
+                        if profiler is None:
+                            stop = context.update()
+                        else:
+                            stop = self.__profile_update(context, profiler)
+                        context._last_update = stop
+                        context._output = None
+                        updated += 1
+                    else:
+                        stop = context._last_update
+                        if stop is None:
+                            stop = context.blocking
+                if stop:
+                    break
+        return updated
+
+    def __finish_input(self, profiler):
+        # Exit if asked to and clear the input read by __update_contexts()
+        if profiler is not None:
+            start = default_timer()
+        if Input.isset('QUIT'):
+            exit()
+
+        Input.update()
+        if profiler is not None:
+            profiler.record('input',
+                            self.__input_time + default_timer() - start)
+
+    def __read_input(self):
+        source = self.input_source
+        if source is None:
+            Input.update_mouse(pygame.mouse.get_pressed(),
+                               pygame.mouse.get_pos())
             Input.add_events(pygame.event.get())
-        
-            if current is not None:
+        else:
+            buttons, pos, events = source.get_input()
+            Input.update_mouse(buttons, pos)
+            Input.add_events(events)
+
+    def __update_current(self, current, profiler):
+        if self.__is_due(current):
+            if profiler is None:
                 current.update()
             else:
-                # Update contexts in reverse order
-                stop = False
-                for context in reversed(self.stack):
-                    if context.active:
-                        #print 'updating %s' % context
-                        stop = context.update()
-                    if stop:
-                        break
-
-            # Draw active contexts in normal order
-            for context in self.stack:
+                self.__profile_update(current, profiler)
+            current._output = None
+            return 1
+        return 0
+
+    def __is_due(self, context):
+        # Whether a Context with an update interval or asleep should be
+        # updated in this cycle
+        if context.sleeping:
+            if context.should_wake():
+                context.wake()
+            elif context._sleep_countdown is None:
+                return False
+            elif context._sleep_countdown > 0:
+                context._sleep_countdown -= 1
+                return False
+            else:
+                context.wake()
+        if context._update_countdown > 0:
+            context._update_countdown -= 1
+            return False
+        context._update_countdown = context.update_interval - 1
+        return True
+
+    def __draw_contexts(self, profiler):
+        # Draw active contexts in normal order, timing each draw() with a
+        # profiler
+        screen = get_screen()
+        for context in self.stack:
+            if profiler is not None:
+                start = default_timer()
+            if ((context.update_interval == 1 and not context.sleeping)
+                or not context.active):
                 context.draw()
-                
-            if Input.isset('QUIT'):
-                exit()
-            
-            Input.update()
-
-            # Flip display
-            get_screen().flip()
-
-            if current is not None and current not in self.stack:
-                self.keep_going = False
-#        print 'gameloop ended'
-        self.keep_going = True
+                if not context.reports_dirty_rects:
+                    screen.mark_all_dirty()
+            else:
+                self.__draw_scheduled(context, screen)
+            if profiler is not None:
+                profiler.record(context.__class__.__name__ + '.draw',
+                                default_timer() - start)
+
+    def __flip(self, profiler):
+        screen = get_screen()
+        if profiler is not None:
+            start = default_timer()
+        screen.flip()
+        if profiler is not None:
+            profiler.record('flip', default_timer() - start)
+
+    def __draw_scheduled(self, context, screen):
+        # Contexts that were not updated since they were last drawn are
+        # not drawn again, the blits they made are repeated instead
+        if context._output is None:
+            screen.start_recording()
+            try:
+                context.draw()
+            finally:
+                context._output = screen.stop_recording()
+            if not context.reports_dirty_rects:
+                screen.mark_all_dirty()
+        else:
+            screen.replay(context._output)
+
+    def __profile_update(self, context, profiler):
+        start = default_timer()
+        stop = context.update()
+        profiler.record(context.__class__.__name__ + '.update',
+                        default_timer() - start)
+        return stop
+
+    def get_map_id(self):
+        """
+        Return the id of the map of the topmost MapController in the
+        stack, or None if there is no map being run.
+        """
+        for context in reversed(self.stack):
+            map_model = getattr(context, 'map_model', None)
+            if map_model is not None:
+                return getattr(map_model, 'id', None)
+        return None
 
     def stack_model(self, model):
         """
@@ -164,6 +458,62 @@ class ContextStack(object):
         self.stack_context(context)
 
 
+class Simulation(object):
+
+    """
+    A Simulation keeps track of the updates run by the gameloop while
+    it is simulating, and decides when it should stop.
+
+    *ticks* is how many updates to run, or None for no limit, and
+    *until* a callable that ends the Simulation when it returns True,
+    checked after each update.
+
+    :attr:`ticks_run`
+        How many updates were run so far.
+
+    :attr:`done`
+        Whether the Simulation reached *ticks* or *until* returned True.
+    """
+
+    def __init__(self, ticks=None, until=None):
+        self.ticks = ticks
+        self.until = until
+        self.ticks_run = 0
+        self.done = False
+        self.start = default_timer()
+        self.end = None
+
+    def step(self):
+        """
+        Count an update and return whether the Simulation is over.
+        """
+        self.ticks_run += 1
+        if ((self.ticks is not None and self.ticks_run >= self.ticks)
+            or (self.until is not None and self.until())):
+            self.done = True
+            self.finish()
+        return self.done
+
+    def finish(self):
+        if self.end is None:
+            self.end = default_timer()
+
+    def get_elapsed(self):
+        """
+        Return how many seconds of real time the Simulation took, or
+        has taken so far if it is still running.
+        """
+        if self.end is None:
+            return default_timer() - self.start
+        return self.end - self.start
+
+    def get_rate(self):
+        """
+        Return how many updates per second of real time were run.
+        """
+        return self.ticks_run / max(self.get_elapsed(), 1e-6)
+
+
 class Context(object):
 
     """
@@ -175,8 +525,46 @@ class Context(object):
     (a button to change the party order, capturing mouse clicks to give
     information about clicked objects) to menus that run along with the
     map, allowing them to be used while the party moves.
+
+    :attr:`reports_dirty_rects`
+        Whether draw() reports the screen regions it changed through
+        ScaledScreen.mark_dirty(). If False, the whole screen is
+        considered changed after the Context is drawn. Contexts that do
+        not draw anything should set it to True.
+
+    :attr:`update_interval`
+        Every how many cycles of the gameloop the Context is updated.
+        In the cycles in between, draw() is not called either and the
+        blit() and fill() calls it made on the screen the last time are
+        repeated instead, so Contexts with an interval other than 1
+        should only draw through those two methods.
+
+    :attr:`sleeping`
+        Whether the Context is asleep, set by sleep() and wake(). A
+        sleeping Context is not updated and its output is repeated the
+        same way as between the updates of Contexts with an
+        update_interval.
+
+    :attr:`blocking`
+        Whether the Context keeps the ones below it from being updated
+        in the cycles it is skipped, while asleep or between the updates
+        of its update_interval. Once it was updated, what its last
+        update() returned is used instead, until it sleeps or its
+        :attr:`active` changes.
     """
 
+    reports_dirty_rects = False
+    update_interval = 1
+    sleeping = False
+    blocking = False
+
+    # Used by the ContextStack to schedule Contexts that are not updated
+    # every cycle
+    _update_countdown = 0
+    _sleep_countdown = None
+    _last_update = None
+    _output = None
+
     def __init__(self, parent=None):
         """
         *Constructor.*
@@ -188,6 +576,22 @@ class Context(object):
         self.active = True
         self.parent = parent
 
+    def get_active(self):
+        return self._active
+
+    def set_active(self, active):
+        self._active = active
+        # Whatever the Context returned and drew while it was updated is
+        # stale once it stops or resumes being updated
+        self._last_update = None
+        self._output = None
+
+    active = property(get_active, set_active)
+    """
+    Whether the Context is updated. Inactive Contexts are still drawn
+    every cycle.
+    """
+
     # Virtual
     def update(self):
         """
@@ -226,6 +630,10 @@ class Context(object):
         virtual_screen.get_screen() and then blit into it. The flip()
         method should not be called, as the ContextStack will do so after
         all Contexts are done drawing.
+
+        If :attr:`reports_dirty_rects` is True, this method should also
+        call mark_dirty() on the screen for every region whose pixels may
+        differ from the previous frame.
         """
         pass
 
@@ -242,6 +650,39 @@ class Context(object):
         """
         pass
 
+    def sleep(self, frames=None):
+        """
+        Stop updating and drawing the Context until wake() is called,
+        should_wake() returns True or, if *frames* is given, that many
+        cycles of the gameloop pass. Until then, the Context's output
+        from the last time it was drawn keeps being shown, and
+        :attr:`blocking` decides whether the Contexts below it are
+        updated.
+        """
+        self.sleeping = True
+        self._sleep_countdown = frames
+        self._last_update = None
+        self._output = None
+
+    def wake(self):
+        """
+        Resume updating and drawing a Context stopped by sleep().
+        """
+        self.sleeping = False
+        self._sleep_countdown = None
+
+    # Virtual
+    def should_wake(self):
+        """
+        *Virtual.*
+
+        Return whether a sleeping Context should wake up.
+
+        This method is called every cycle while the Context is asleep,
+        so it should be cheap.
+        """
+        return False
+
     def stop(self):
         """
         Stop the Context from running and remove it from its ContextStack.
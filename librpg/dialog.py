@@ -320,6 +320,8 @@ class ChoiceLabel(Label):
 
 class MessageQueue(Context):
 
+    reports_dirty_rects = True
+
     def __init__(self, parent=None):
         Context.__init__(self, parent)
         self.current = None
@@ -5,14 +5,52 @@ pygame Surfaces, which is used by several other modules.
 Specialized images for tiles, map objects are also provided in this
 module, as well as the SlicedImage class, which is an Image divisible
 in pieces of the same size.
+
+Surfaces loaded from files should go through :func:`convert_surface`
+(or be loaded with :func:`load_image`), so that they are stored in the
+display's pixel format and blit without per-frame conversion.
 """
 
 import pygame
+from pygame.locals import SRCALPHA, RLEACCEL
 
 from librpg.locals import (UP, RIGHT, DOWN, LEFT,
                            DEFAULT_OBJECT_IMAGE_BASIC_ANIMATION,
                            SPEEDS, NORMAL_SPEED)
 from librpg.config import graphics_config
+from librpg.virtualscreen import prescale
+
+
+def convert_surface(surface):
+    """
+    Return a copy of *surface* in the display's pixel format.
+
+    Surfaces without translucent pixels are converted to the opaque
+    display format, and their colorkey, if any, is RLE accelerated.
+    Surfaces with translucent pixels keep a per-pixel alpha channel.
+
+    If the display has not been set up yet, *surface* is returned
+    unchanged.
+    """
+    if pygame.display.get_surface() is None:
+        return surface
+    if surface.get_flags() & SRCALPHA:
+        alphas = pygame.image.tostring(surface, 'RGBA')[3::4]
+        if alphas.count('\xff') != len(alphas):
+            return surface.convert_alpha()
+    colorkey = surface.get_colorkey()
+    result = surface.convert()
+    if colorkey is not None:
+        result.set_colorkey(colorkey, RLEACCEL)
+    return result
+
+
+def load_image(filename):
+    """
+    Load the image in *filename* and return it as a Surface in the
+    display's pixel format. See :func:`convert_surface`.
+    """
+    return convert_surface(pygame.image.load(filename))
 
 
 class Image(object):
@@ -23,7 +61,7 @@ class Image(object):
     This is the base class for more complex and animated images.
     """
 
-    def __init__(self, surface):
+    def __init__(self, surface, static=False):
         """
         *Constructor.*
 
@@ -31,12 +69,20 @@ class Image(object):
         that the surface is not copied, which means it should not be
         altered after being passed to this class.
 
+        If *static* is True, the surface is registered with
+        *librpg.virtualscreen.prescale()*, so a scaled copy of it is
+        kept instead of scaling it on every blit. Only pass True for
+        surfaces that will never be changed, since the copy would not
+        follow the changes.
+
         :attr:`surface`
             Pygame Surface containing the image.
         """
         self.surface = surface
         self.height = surface.get_height()
         self.width = surface.get_width()
+        if static:
+            prescale(surface, lazy=True)
 
     def get_surface(self, obj=None):
         """
@@ -83,6 +129,8 @@ class TileImage(Image):
         Image.__init__(self, surfaces[0])
         self.surfaces = surfaces
         self.phases = len(surfaces)
+        for surface in surfaces:
+            prescale(surface)
 
     def get_surface(self, obj=None, animation_phase=0):
         """
@@ -148,7 +196,8 @@ class ObjectImage(Image):
         chunk_width = self.frame_number * graphics_config.object_width
         chunk_height = 4 * graphics_config.object_height
         sliced_file = SlicedImage(file_surface, chunk_width, chunk_height)
-        Image.__init__(self, sliced_file.get_slice(index))
+        Image.__init__(self, convert_surface(sliced_file.get_slice(index)),
+                       static=True)
 
         # Create a sprite matrix [facing x frame]
         sliced_image = SlicedImage(self.surface,
@@ -160,7 +209,9 @@ class ObjectImage(Image):
             phases = []
             self.frames.append(phases)
             for x in range(self.frame_number):
-                phases.append(sliced_image.get_slice_xy(x, y))
+                frame = sliced_image.get_slice_xy(x, y)
+                prescale(frame)
+                phases.append(frame)
 
         self.width = graphics_config.object_width
         self.height = graphics_config.object_height
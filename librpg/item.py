@@ -10,7 +10,7 @@ UniqueItems (stored in UniquesInventories) are items that will not be
 stacked, being stored in the inventory individually.
 """
 
-from librpg.image import Image, SlicedImage
+from librpg.image import Image, SlicedImage, convert_surface
 from librpg.config import graphics_config as g_cfg
 import pygame
 
@@ -432,7 +432,8 @@ class Item(object):
         icon_w = g_cfg.item_icon_width if len(loc) <= 2 else loc[2]
         icon_h = g_cfg.item_icon_height if len(loc) <= 3 else loc[3]
         sliced_img = SlicedImage(image, icon_w, icon_h)
-        return Image(sliced_img.get_slice(loc[1]))
+        return Image(convert_surface(sliced_img.get_slice(loc[1])),
+                     static=True)
 
 
 class OrdinaryItem(Item):
@@ -0,0 +1,225 @@
+"""
+The :mod:`layercache` module stores the map layers composed by MapViews
+on disk, so that a map that was already shown can be loaded again
+without composing its layers tile by tile.
+
+The pixels are stored exactly as they are in memory, in the format of
+the Surfaces MapView composes, which is the display format. Files are
+memory-mapped where possible, and the Surfaces are built directly on
+their data with pygame.image.frombuffer(), so loading a layer copies
+and converts nothing, and only the parts that are drawn are read.
+"""
+
+import os
+import mmap
+import struct
+import hashlib
+
+import pygame
+from pygame.locals import SRCALPHA
+
+from librpg.config import graphics_config as g_cfg
+
+# Bump whenever the way layers are composed or stored changes, so that
+# layers cached by older versions are not used
+VERSION = 3
+
+MAGIC = 'LRPGLAYR'
+# Magic, piece count, bits and bytes per pixel and the RGBA masks
+HEADER = struct.Struct('<8sIII4I')
+# Topleft, size and pitch of a piece
+PIECE_HEADER = struct.Struct('<iiIII')
+# The pixels of each piece start at a multiple of this offset
+ALIGNMENT = 16
+
+# pygame.image.frombuffer() formats with each number of bytes per pixel
+BUFFER_FORMATS = {3: 'RGB', 4: 'RGBX'}
+
+
+def align(offset):
+    return (offset + ALIGNMENT - 1) / ALIGNMENT * ALIGNMENT
+
+
+class LayerCache(object):
+
+    """
+    A directory with composed map layers stored as raw pixel buffers.
+
+    Layers are identified by a key, which is a hash of everything they
+    are composed from, and a name.
+
+    directory: string (read-only)
+    Path of the directory where the layers are stored. It is created
+    when the first layer is saved.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def get_key(self, map_model):
+        """
+        Return the key for the layers of *map_model*, a hash of its map
+        file, its tileset images and boundaries files and the graphics
+        configuration that affects them.
+        """
+        digest = hashlib.sha1()
+        digest.update('%d %d' % (VERSION, g_cfg.tile_size))
+        tilesets = ([map_model.terrain_tileset_files]
+                    + list(map_model.scenario_tileset_files_list))
+        filenames = [map_model.map_file]
+        for image_file, boundaries_file in tilesets:
+            filenames.append(image_file)
+            filenames.append(boundaries_file)
+        for filename in filenames:
+            f = open(filename, 'rb')
+            try:
+                digest.update(f.read())
+            finally:
+                f.close()
+        return digest.hexdigest()
+
+    def get_filename(self, key, name):
+        return os.path.join(self.directory, '%s-%s.layer' % (key, name))
+
+    def get_format(self, alpha):
+        """
+        Return the (bits per pixel, bytes per pixel, masks, shifts) of
+        the Surfaces composed by MapView, with an alpha channel if
+        *alpha* is True.
+        """
+        if alpha:
+            surface = pygame.Surface((1, 1), SRCALPHA, 32)
+        else:
+            surface = pygame.Surface((1, 1))
+        return (surface.get_bitsize(), surface.get_bytesize(),
+                surface.get_masks(), surface.get_shifts())
+
+    def load(self, key, name, alpha):
+        """
+        Return the layer stored under *key* and *name* as a list of
+        ((x, y), Surface) pieces, or None if the layer is not in the
+        cache or was stored in another pixel format.
+
+        *alpha* indicates whether the layer has an alpha channel.
+
+        The Surfaces share the memory-mapped data of the file, which
+        stays mapped while any of them exists.
+        """
+        filename = self.get_filename(key, name)
+        if not os.path.exists(filename):
+            return None
+
+        f = open(filename, 'rb')
+        try:
+            try:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+            except (EnvironmentError, ValueError):
+                data = f.read()
+        finally:
+            f.close()
+        pieces = self.read_pieces(data, alpha)
+        if pieces is None and isinstance(data, mmap.mmap):
+            data.close()
+        return pieces
+
+    def read_pieces(self, data, alpha):
+        if len(data) < HEADER.size:
+            return None
+        header = HEADER.unpack(data[:HEADER.size])
+        magic, count, bitsize, bytesize = header[:4]
+        masks = header[4:]
+        format = self.get_format(alpha)
+        if magic != MAGIC or (bitsize, bytesize, masks) != format[:3]:
+            return None
+
+        # Check the whole file before building any Surface on it
+        layout = []
+        offset = HEADER.size
+        for i in xrange(count):
+            if len(data) < offset + PIECE_HEADER.size:
+                return None
+            x, y, width, height, pitch = PIECE_HEADER.unpack(
+                                data[offset:offset + PIECE_HEADER.size])
+            offset = align(offset + PIECE_HEADER.size)
+            length = pitch * height
+            if pitch < width * bytesize or len(data) < offset + length:
+                return None
+            layout.append(((x, y), (width, height), pitch, offset))
+            offset += length
+        if offset != len(data):
+            return None
+
+        pieces = []
+        for topleft, size, pitch, offset in layout:
+            surface = self.build_surface(data, offset, size, pitch, alpha,
+                                         format)
+            if surface is None:
+                return None
+            pieces.append((topleft, surface))
+        return pieces
+
+    def build_surface(self, data, offset, size, pitch, alpha, format):
+        bitsize, bytesize, masks, shifts = format
+        length = pitch * size[1]
+        buffer_format = BUFFER_FORMATS.get(bytesize)
+        if buffer_format is not None and pitch == size[0] * bytesize:
+            if alpha:
+                buffer_format = 'RGBA'
+            surface = pygame.image.frombuffer(buffer(data, offset, length),
+                                              size, buffer_format)
+            # frombuffer() only knows its own byte orders, so the pixels
+            # are read with the masks they were stored with
+            surface.set_masks(masks)
+            surface.set_shifts(shifts)
+            return surface
+
+        # Formats frombuffer() cannot describe are copied instead
+        surface = pygame.Surface(size, alpha and SRCALPHA or 0, bitsize,
+                                 masks)
+        if surface.get_pitch() != pitch:
+            return None
+        surface.get_buffer().write(data[offset:offset + length], 0)
+        return surface
+
+    def save(self, key, name, pieces, alpha):
+        """
+        Store the layer made of *pieces*, a list of ((x, y), Surface)
+        tuples, under *key* and *name*. *alpha* indicates whether the
+        Surfaces have an alpha channel.
+
+        Failures to write the file are ignored, leaving the layer out
+        of the cache.
+        """
+        bitsize, bytesize, masks, shifts = self.get_format(alpha)
+        for topleft, surface in pieces:
+            if (surface.get_bitsize() != bitsize
+                or surface.get_masks() != masks):
+                return
+
+        filename = self.get_filename(key, name)
+        temp_filename = '%s.%d.tmp' % (filename, os.getpid())
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            f = open(temp_filename, 'wb')
+            try:
+                f.write(HEADER.pack(MAGIC, len(pieces), bitsize, bytesize,
+                                    *masks))
+                offset = HEADER.size
+                for (x, y), surface in pieces:
+                    width, height = surface.get_size()
+                    pitch = surface.get_pitch()
+                    f.write(PIECE_HEADER.pack(x, y, width, height, pitch))
+                    offset += PIECE_HEADER.size
+                    f.write('\0' * (align(offset) - offset))
+                    pixels = surface.get_buffer().raw
+                    f.write(pixels)
+                    offset = align(offset) + len(pixels)
+            finally:
+                f.close()
+            if os.path.exists(filename):
+                os.remove(filename)
+            os.rename(temp_filename, filename)
+        except EnvironmentError:
+            if os.path.exists(temp_filename):
+                os.remove(temp_filename)
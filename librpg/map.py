@@ -4,13 +4,16 @@ the definition of MapModel, which is the class representing a map in
 which a party will walk, act, etc.
 """
 
-import csv
+import bisect
+from array import array
+from operator import itemgetter
 
 from librpg.mapobject import PartyAvatar
 from librpg.mapview import MapView
 from librpg.sound import MapMusic
-from librpg.util import (determine_facing, Position, Matrix, inverse)
-from librpg.tile import Tileset
+from librpg.util import (determine_facing, Position, inverse)
+from librpg.tile import Tileset, TileLayer, Tile
+from librpg.mapfile import load_map_file, get_tileset_files
 from librpg.config import game_config
 from librpg.locals import (DOWN, NORMAL_SPEED, PARTY_POSITION_LOCAL_STATE, UP,
                            LEFT, RIGHT, M_1)
@@ -18,21 +21,37 @@ from librpg.movement import Step, PathMovement
 from librpg.context import Context, Model, get_context_stack
 from librpg.dialog import MessageQueue
 from librpg.input import Input
+from librpg.virtualscreen import get_screen
+from librpg.color import BLACK
+
+
+# Bit of a direction in MapModel.passability, and of its inverse
+DIRECTION_BITS = {UP: 1 << (UP - 1), RIGHT: 1 << (RIGHT - 1),
+                  DOWN: 1 << (DOWN - 1), LEFT: 1 << (LEFT - 1)}
+INVERSE_BITS = {UP: DIRECTION_BITS[DOWN], RIGHT: DIRECTION_BITS[LEFT],
+                DOWN: DIRECTION_BITS[UP], LEFT: DIRECTION_BITS[RIGHT]}
+ALL_DIRECTIONS = 15
 
 
 class MapController(Context):
 
     # Read-Only Attributes:
-    # map_view - MapView (View component of MVC)
+    # map_view - MapView (View component of MVC), None while simulating
     # map_model - MapModel (Model component of MVC)
 
+    reports_dirty_rects = True
+
     def __init__(self, map_model, parent=None):
         Context.__init__(self, parent)
         self.map_model = map_model
         self.map_model.controller = self
         self.map_model.initialize(self.map_model.local_state,
                                   self.map_model.global_state)
-        self.map_view = MapView(self.map_model)
+        if get_context_stack().simulation is None:
+            self.map_view = MapView(self.map_model)
+        else:
+            # Nothing is drawn while simulating
+            self.map_view = None
         self.map_music = MapMusic(self.map_model)
         self.__moving_sync = False
         self.message_queue = MessageQueue(self)
@@ -41,7 +60,8 @@ class MapController(Context):
 
     def initialize(self):
         map_model = self.map_model
-        self.__map_view_draw = self.map_view.draw
+        if self.map_view is not None:
+            self.__map_view_draw = self.map_view.draw
         self.party_avatar = map_model.party_avatar
 
         # Initialize contexts
@@ -51,6 +71,9 @@ class MapController(Context):
             context_stack.stack_context(context)
 
     def update(self):
+        if self.map_view is not None and not self.map_view.ready:
+            return False
+
         if self.map_model.pause_delay > 0:
             self.map_model.pause_delay -= 1
             return False
@@ -116,15 +139,40 @@ class MapController(Context):
 
         if game_config.map_mouse_enabled:
             evt = Input.was_pressed(M_1)
-            if evt is not None:
+            if evt is not None and self.map_view is not None:
                 if not self.party_avatar.scheduled_movement:
                     self.__mouse_movement(evt.pos)
                     return
 
     def draw(self):
-        self.__map_view_draw()
+        if self.map_view is None:
+            if get_context_stack().simulation is not None:
+                return
+            # The map was created during a simulation that has stopped
+            self.map_view = MapView(self.map_model)
+            self.__map_view_draw = self.map_view.draw
+        if self.map_view.ready:
+            self.__map_view_draw()
+        else:
+            self.draw_loading()
         self.map_music.update()
 
+    def draw_loading(self):
+        """
+        *Virtual.*
+
+        Draw the screen shown while the map is not ready to be drawn,
+        because its layers are still being composed in a separate thread.
+        By default the screen is filled with black.
+        """
+        screen = get_screen()
+        screen.fill(BLACK)
+        screen.mark_all_dirty()
+
+    def destroy(self):
+        if self.map_view is not None:
+            self.map_view.destroy()
+
     def __flow_object_movement(self):
         party_avatar = self.map_model.party_avatar
 
@@ -183,6 +231,8 @@ class MapController(Context):
         get_context_stack().stop()
 
     def __mouse_movement(self, pos):
+        if self.map_view is None:
+            return
         target_x, target_y = self.map_view.calc_pos_from_mouse(pos)
         if self.map_model.terrain_layer.valid((target_x, target_y)):
             movement = PathMovement(self.map_model,
@@ -206,7 +256,7 @@ class MapModel(Model):
         *Constructor:*
 
         Initialize the MapModel with a layout defined by *map_file* (a .map
-        file).
+        file, or a compiled map made from one by mapfile.compile_map()).
 
         The terrain tileset is specified by *terrain_tileset_files*, which
         is a tuple (tileset image filename, tileset boundaries filename).
@@ -217,9 +267,20 @@ class MapModel(Model):
         *scenario_tileset_files_list*, a list of tuples like the one passed
         as *terrain_tileset_files*. Each will correspond to a scenario
         layer.
+
+        If *map_file* is a compiled map, either may be None to use the
+        tilesets it references.
         """
         Model.__init__(self)
 
+        # can_move() reads the passability of the cells, unless a subclass
+        # overrides the hooks that decide it tile by tile
+        cls = self.__class__
+        self.__obstruction_overridden = (
+            cls.is_obstructed.im_func is not MapModel.is_obstructed.im_func
+            or cls.direction_obstructed.im_func
+            is not MapModel.direction_obstructed.im_func)
+
         self.world = None
         self.id = None
 
@@ -231,6 +292,13 @@ class MapModel(Model):
 
         # Load file data
         self.map_file = map_file
+        if terrain_tileset_files is None or\
+           scenario_tileset_files_list is None:
+            tileset_files = get_tileset_files(map_file)
+            if terrain_tileset_files is None:
+                terrain_tileset_files = tileset_files[0]
+            if scenario_tileset_files_list is None:
+                scenario_tileset_files_list = tileset_files[1:]
         self.terrain_tileset_files = terrain_tileset_files
         self.scenario_tileset_files_list = scenario_tileset_files_list
 
@@ -250,57 +318,90 @@ class MapModel(Model):
         self.obstacle_objects = []
         self.above_objects = []
         self.updatable_objects = []
-        self.object_layer = Matrix(self.width, self.height)
-        for x in range(self.width):
-            for y in range(self.height):
-                self.object_layer[x, y] = ObjectCell()
+        self.below_index = ObjectIndex()
+        self.obstacle_index = ObjectIndex()
+        self.above_index = ObjectIndex()
+        self.object_layer = ObjectLayer(self.width, self.height)
 
         # Set up areas
         self.areas = []
-        self.area_layer = Matrix(self.width, self.height)
-        for x in range(self.width):
-            for y in range(self.height):
-                self.area_layer[x, y] = []
+        self.area_layer = AreaLayer(self.width, self.height)
 
         # Set up context system
         self.pause_delay = 0
         self.contexts = []
 
     def load_from_map_file(self):
-        layout_file = open(self.map_file)
-        r = csv.reader(layout_file, delimiter=',')
-
-        first_line = r.next()
-        self.width = int(first_line[0])
-        self.height = int(first_line[1])
-        self.scenario_number = int(first_line[2])
-
-        self.terrain_layer = Matrix(self.width, self.height)
-        self.scenario_layer = [Matrix(self.width, self.height) for i in\
-                               range(self.scenario_number)]
-
-        y = 0
-        for line in r:
-            if len(line) == self.width:
-                for x, value in enumerate(line):
-                    self.terrain_layer[x, y] = self.terrain_tileset.\
-                                               tiles[int(value)]
-                y += 1
-            if y >= self.height:
-                break
-
-        for i in xrange(self.scenario_number):
-            y = 0
-            for line in r:
-                if len(line) == self.width:
-                    for x, value in enumerate(line):
-                        tile = self.scenario_tileset[i].tiles[int(value)]
-                        self.scenario_layer[i][x, y] = tile
-                    y += 1
-                if y >= self.height:
-                    break
+        layout = load_map_file(self.map_file)
+        self.width = layout.width
+        self.height = layout.height
+        self.scenario_number = layout.get_scenario_number()
+
+        self.terrain_layer = TileLayer(self.terrain_tileset, self.width,
+                                       self.height)
+        self.scenario_layer = [TileLayer(self.scenario_tileset[i],
+                                         self.width, self.height)
+                               for i in range(self.scenario_number)]
+
+        layers = [self.terrain_layer] + self.scenario_layer
+        for layer, ids in zip(layers, layout.layers):
+            layer.set_ids(ids)
+
+        self.passability = array('B', [0]) * (self.width * self.height)
+        self.passability_cache = None
+        self.update_passability()
+        for layer in [self.terrain_layer] + self.scenario_layer:
+            layer.on_change = self.update_passability
+            layer.tileset.on_change = self.update_passability
+
+    def update_passability(self, start=0, stop=None):
+        """
+        Recompute the passability of the cells from index *start* up to,
+        but not including, *stop*, or of the whole map by default.
 
-        layout_file.close()
+        It is called whenever a tile is set in one of the layers, and for
+        the whole map whenever the attribute tables of their Tilesets are
+        built again.
+        """
+        if (self.passability_cache is None
+            or not self.passability_cache.is_current()):
+            # The tables changed, so any cell may have a new passability
+            self.passability_cache = PassabilityCache(self)
+            start, stop = 0, None
+        if stop is None:
+            stop = self.width * self.height
+        layers = [self.terrain_layer] + self.scenario_layer
+        cells = zip(*[layer.ids[start:stop] for layer in layers])
+        values = map(self.passability_cache.__getitem__, cells)
+        self.passability[start:stop] = array('B', values)
+
+    def compute_passability(self, ids):
+        """
+        Return the passability of a cell with the tiles *ids*, a tuple
+        with the id of its terrain tile followed by the ids of its
+        scenario tiles. It is a bitmask with the bit
+        DIRECTION_BITS[direction] set if the cell can be entered or left
+        by the *direction* side.
+        """
+        # Scenario tiles are looked at top to bottom, each closing its
+        # sides, until an obstacle or a below tile hides the ones under it
+        closed = 0
+        for i in reversed(xrange(self.scenario_number)):
+            tileset = self.scenario_layer[i].tileset
+            id = ids[i + 1]
+            obstacle = tileset.obstacles[id]
+            if obstacle == Tile.OBSTACLE or obstacle == Tile.COUNTER:
+                return 0
+            closed |= tileset.closed_directions[id]
+            if obstacle == Tile.BELOW:
+                return ALL_DIRECTIONS & ~closed
+
+        tileset = self.terrain_layer.tileset
+        id = ids[0]
+        obstacle = tileset.obstacles[id]
+        if obstacle == Tile.OBSTACLE or obstacle == Tile.COUNTER:
+            return 0
+        return ALL_DIRECTIONS & ~(closed | tileset.closed_directions[id])
 
     # Virtual, should be implemented.
     def initialize(self, local_state, global_state):
@@ -358,15 +459,18 @@ class MapModel(Model):
         occupied by an obstacle and the object to be added is also an
         obstacle).
         """
-        self.object_layer[position].add_object(obj)
+        self.object_layer.add_object(obj, position)
 
         self.objects.append(obj)
         if obj.is_below():
             self.below_objects.append(obj)
+            self.below_index.add(obj, position)
         elif obj.is_obstacle():
             self.obstacle_objects.append(obj)
+            self.obstacle_index.add(obj, position)
         elif obj.is_above():
             self.above_objects.append(obj)
+            self.above_index.add(obj, position)
         else:
             raise Exception('Object is neither below, obstacle or above')
         if hasattr(obj, 'update'):
@@ -385,16 +489,19 @@ class MapModel(Model):
         self.objects.remove(obj)
         if obj.is_below():
             self.below_objects.remove(obj)
+            self.below_index.remove(obj, obj.position)
         elif obj.is_obstacle():
             self.obstacle_objects.remove(obj)
+            self.obstacle_index.remove(obj, obj.position)
         elif obj.is_above():
             self.above_objects.remove(obj)
+            self.above_index.remove(obj, obj.position)
         else:
             raise Exception('Object is neither below, obstacle or above')
         if hasattr(obj, 'update'):
             self.updatable_objects.remove(obj)
 
-        self.object_layer[obj.position].remove_object(obj)
+        self.object_layer.remove_object(obj, obj.position)
         result = obj.position
         obj.position, obj.map = None, None
         return result
@@ -407,7 +514,8 @@ class MapModel(Model):
         """
         self.areas.append(area)
         for pos in positions:
-            self.area_layer[pos].append(area)
+            self.area_layer.add_area(area, pos)
+            self.refresh_object_areas(pos)
         area.area = positions
 
     def remove_area(self, area, positions):
@@ -418,9 +526,22 @@ class MapModel(Model):
         """
         self.areas.remove(area)
         for pos in area.area:
-            self.area_layer[pos].remove(area)
+            self.area_layer.remove_area(area, pos)
+            self.refresh_object_areas(pos)
         area.area = list(set(area.area) - set(positions))
 
+    def refresh_object_areas(self, position):
+        # The area list of a cell is replaced when it is created or
+        # dropped, so the objects over it need the new one
+        areas = self.area_layer[position]
+        cell = self.object_layer[position]
+        for obj in cell.below:
+            obj.areas = areas
+        if cell.obstacle is not None:
+            cell.obstacle.areas = areas
+        for obj in cell.above:
+            obj.areas = areas
+
     def try_to_move_object(self, obj, direction, slide=False, back=False):
         """
         Try to move an object to the specified direction (UP, DOWN, LEFT or
@@ -444,9 +565,7 @@ class MapModel(Model):
 
         if not obj.is_obstacle() or self.can_move(old_pos, desired, direction):
             # Move
-            old_object = self.object_layer[old_pos]
-            new_object = self.object_layer[desired]
-            self.move_object(obj, old_object, new_object, desired, slide, back)
+            self.move_object(obj, desired, slide, back)
             if obj is self.party_avatar:
                 for area in self.area_layer[old_pos]:
                     if area not in self.area_layer[desired]:
@@ -464,20 +583,40 @@ class MapModel(Model):
         if not self.terrain_layer.valid(desired):
             return False
 
-        old_terrain = self.terrain_layer[old_pos]
-        new_terrain = self.terrain_layer[desired]
-        old_scenario = [self.scenario_layer[i][old_pos] for i in\
-                        range(self.scenario_number)]
-        new_scenario = [self.scenario_layer[i][desired] for i in\
-                        range(self.scenario_number)]
-        new_object = self.object_layer[desired]
+        if self.__obstruction_overridden:
+            old_terrain = self.terrain_layer[old_pos]
+            new_terrain = self.terrain_layer[desired]
+            old_scenario = [layer[old_pos] for layer in self.scenario_layer]
+            new_scenario = [layer[desired] for layer in self.scenario_layer]
+            new_object = self.object_layer[desired]
+            return not self.is_obstructed(old_terrain, old_scenario,
+                                          new_terrain, new_scenario,
+                                          new_object, direction)
 
-        return not self.is_obstructed(old_terrain, old_scenario, new_terrain,
-                                      new_scenario, new_object, direction)
+        if self.object_layer[desired].obstacle is not None:
+            return False
+
+        width = self.width
+        passability = self.passability
+        return bool(passability[old_pos.y * width + old_pos.x]
+                    & DIRECTION_BITS[direction] and
+                    passability[desired.y * width + desired.x]
+                    & INVERSE_BITS[direction])
 
     def is_obstructed(self, old_terrain, old_scenario_list, new_terrain,
                       new_scenario_list, new_object, direction):
+        """
+        *Virtual.*
 
+        Return whether moving in *direction* from the cell with the Tiles
+        *old_terrain* and *old_scenario_list* to the cell with the Tiles
+        *new_terrain* and *new_scenario_list*, and the ObjectCell
+        *new_object*, is obstructed.
+
+        can_move() only calls it, and direction_obstructed(), if a
+        subclass overrides either of them. Otherwise it reads the
+        passability of the cells, which gives the same results faster.
+        """
         if new_object.obstacle is not None:
             return True
 
@@ -491,7 +630,22 @@ class MapModel(Model):
 
         return False
 
+    def direction_obstructed_at(self, pos, direction):
+        """
+        Return whether the tiles at *pos* keep it from being left or
+        entered by the *direction* side.
+        """
+        index = self.terrain_layer.get_index(pos)
+        return not self.passability[index] & DIRECTION_BITS[direction]
+
     def direction_obstructed(self, terrain, scenario_list, direction):
+        """
+        *Virtual.*
+
+        Return whether the Tiles *terrain* and *scenario_list* of a cell
+        keep it from being left or entered by the *direction* side. See
+        is_obstructed().
+        """
         for scenario in reversed(scenario_list):
             if scenario.cannot_be_entered(direction)\
                or scenario.is_obstacle():
@@ -504,13 +658,13 @@ class MapModel(Model):
         else:
             return False
 
-    def move_object(self, obj, old_object, new_object, new_pos, slide, back):
+    def move_object(self, obj, new_pos, slide, back):
         obj.movement_phase = obj.speed - 1
         obj.sliding = slide
         obj.going_back = back
 
-        old_object.remove_object(obj)
-        new_object.add_object(obj)
+        self.object_layer.move_object(obj, obj.position, new_pos)
+        self.get_object_index(obj).move(obj, obj.position, new_pos)
         obj.prev_position = obj.position
         obj.position = new_pos
         obj.prev_areas = obj.areas
@@ -518,16 +672,25 @@ class MapModel(Model):
 
     def teleport_object(self, obj, new_pos):
         old_pos = obj.position
-        old_object = self.object_layer[old_pos]
-        new_object = self.object_layer[new_pos]
-
-        old_object.remove_object(obj)
-        new_object.add_object(obj)
+        self.object_layer.move_object(obj, old_pos, new_pos)
+        self.get_object_index(obj).move(obj, old_pos, new_pos)
         obj.prev_position = old_pos
         obj.position = new_pos
         obj.prev_areas = obj.areas
         obj.areas = self.area_layer[new_pos]
 
+    def get_object_index(self, obj):
+        """
+        Return the ObjectIndex that holds *obj*, according to whether it
+        is a below, obstacle or above object.
+        """
+        if obj.is_below():
+            return self.below_index
+        elif obj.is_obstacle():
+            return self.obstacle_index
+        else:
+            return self.above_index
+
     def party_action(self):
         old_pos = self.party_avatar.position
         desired = old_pos.step(self.party_avatar.facing)
@@ -541,8 +704,8 @@ class MapModel(Model):
             across_pos = desired.step(self.party_avatar.facing)
             if (self.terrain_layer.valid(across_pos) and
                ((obj_in_front is not None and obj_in_front.is_counter()) or
-               any([layer[desired].is_counter() for layer in\
-                    self.scenario_layer]))):
+               any([layer.get_obstacle(desired) == Tile.COUNTER
+                    for layer in self.scenario_layer]))):
                 # Counter attribute
                 obj_across = self.object_layer[across_pos].obstacle
                 if obj_across is not None:
@@ -646,6 +809,133 @@ class MapModel(Model):
         self.global_state = global_state
 
 
+class SparseLayer(object):
+
+    """
+    A SparseLayer holds a value for some cells of a map, indexed by
+    (x, y) like a Matrix. Only the cells with a value take memory, and
+    indexing any other cell returns the *empty* value.
+
+    :attr:`width`
+        Layer width.
+
+    :attr:`height`
+        Layer height.
+
+    :attr:`cells`
+        Dict mapping the index y * width + x of each cell with a value to
+        that value.
+    """
+
+    def __init__(self, width, height, empty):
+        self.width = width
+        self.height = height
+        self.empty = empty
+        self.cells = {}
+
+    def __repr__(self):
+        return '(%s %s x %s, %s cells)' % (self.__class__.__name__,
+                                           self.width, self.height,
+                                           len(self.cells))
+
+    def __getitem__(self, pos):
+        """
+        Return the value at *pos* == (x, y).
+
+        Raises IndexError if x or y are not inside the layer's limits.
+        """
+        return self.cells.get(self.get_index(pos), self.empty)
+
+    def valid(self, pos):
+        """
+        Return whether *pos* == (x, y) is inside the layer's limits.
+        """
+        x, y = pos
+        return x < self.width and x >= 0 and y < self.height and y >= 0
+
+    def get_index(self, pos):
+        x, y = pos
+        if not self.valid(pos):
+            raise IndexError('%s was indexed with x=%s y=%s'
+                             % (repr(self), x, y))
+        return y * self.width + x
+
+
+class ObjectLayer(SparseLayer):
+
+    """
+    An ObjectLayer holds the ObjectCell of each map cell with objects
+    over it. Cells get an ObjectCell when the first object is added and
+    lose it when the last one is removed. Indexing a cell without objects
+    returns EMPTY_OBJECT_CELL.
+    """
+
+    def __init__(self, width, height):
+        SparseLayer.__init__(self, width, height, EMPTY_OBJECT_CELL)
+
+    def add_object(self, obj, pos):
+        """
+        Add *obj* to the ObjectCell at *pos*.
+        """
+        index = self.get_index(pos)
+        cell = self.cells.get(index)
+        if cell is None:
+            cell = self.cells[index] = ObjectCell()
+        cell.add_object(obj)
+
+    def remove_object(self, obj, pos):
+        """
+        Remove *obj* from the ObjectCell at *pos*.
+        """
+        index = self.get_index(pos)
+        cell = self.cells.get(index)
+        if cell is None:
+            # Another obstacle took its place and was already removed
+            return
+        cell.remove_object(obj)
+        if cell.is_empty():
+            del self.cells[index]
+
+    def move_object(self, obj, old_pos, new_pos):
+        """
+        Move *obj* from the ObjectCell at *old_pos* to the one at
+        *new_pos*.
+        """
+        self.remove_object(obj, old_pos)
+        self.add_object(obj, new_pos)
+
+
+class AreaLayer(SparseLayer):
+
+    """
+    An AreaLayer holds the list of MapAreas over each map cell that has
+    any. Indexing a cell without areas returns an empty tuple.
+    """
+
+    def __init__(self, width, height):
+        SparseLayer.__init__(self, width, height, ())
+
+    def add_area(self, area, pos):
+        """
+        Add *area* to the list at *pos*.
+        """
+        index = self.get_index(pos)
+        areas = self.cells.get(index)
+        if areas is None:
+            areas = self.cells[index] = []
+        areas.append(area)
+
+    def remove_area(self, area, pos):
+        """
+        Remove *area* from the list at *pos*.
+        """
+        index = self.get_index(pos)
+        areas = self.cells.get(index, [])
+        areas.remove(area)
+        if not areas:
+            del self.cells[index]
+
+
 class ObjectCell(object):
 
     def __init__(self):
@@ -674,3 +964,147 @@ class ObjectCell(object):
             self.below_remove(obj)
         else:
             self.above_remove(obj)
+
+    def is_empty(self):
+        return (self.obstacle is None and not self.below
+                and not self.above)
+
+
+class EmptyObjectCell(ObjectCell):
+
+    # The ObjectCell of the cells without objects, which is shared and
+    # so cannot be changed
+
+    def __init__(self):
+        self.below = ()
+        self.obstacle = None
+        self.above = ()
+
+    def add_object(self, obj):
+        raise TypeError('Objects are added through ObjectLayer.add_object')
+
+    def remove_object(self, obj):
+        raise TypeError('Objects are removed through '
+                        'ObjectLayer.remove_object')
+
+
+EMPTY_OBJECT_CELL = EmptyObjectCell()
+
+
+class ObjectIndex(object):
+
+    """
+    An ObjectIndex is a spatial index of MapObjects. It groups the
+    objects of each map line in buckets of BUCKET_SIZE tiles, kept sorted
+    by x, so that the objects in an area of the map can be found in
+    depth order (top to bottom, then left to right) without going
+    through all of them or sorting them.
+
+    It has to be told whenever an object is added, moved or removed.
+    """
+
+    BUCKET_SIZE = 8
+
+    def __init__(self):
+        self.buckets = {}
+        self.order = {}
+        self.count = 0
+
+    def add(self, obj, position):
+        self.count += 1
+        self.order[obj] = self.count
+        self.__insert(obj, position)
+
+    def remove(self, obj, position):
+        self.__remove(obj, position)
+        del self.order[obj]
+
+    def move(self, obj, old_position, new_position):
+        if (old_position[0] != new_position[0]
+            or old_position[1] != new_position[1]):
+            self.__remove(obj, old_position)
+            self.__insert(obj, new_position)
+
+    def __insert(self, obj, position):
+        x, y = position
+        key = (x / ObjectIndex.BUCKET_SIZE, y)
+        entry = (x, self.order[obj], obj)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            self.buckets[key] = [entry]
+        else:
+            bisect.insort(bucket, entry)
+
+    def __remove(self, obj, position):
+        x, y = position
+        key = (x / ObjectIndex.BUCKET_SIZE, y)
+        bucket = self.buckets[key]
+        for i, entry in enumerate(bucket):
+            if entry[2] is obj:
+                del bucket[i]
+                break
+        if not bucket:
+            del self.buckets[key]
+
+    def query(self, left, top, right, bottom, depth_order=True):
+        """
+        Return the objects that may be between the tile columns *left*
+        and *right* and the tile lines *top* and *bottom*, inclusive.
+        Objects in the same bucket as those tiles may also be returned.
+
+        If *depth_order* is True, the objects are sorted by their
+        position, line first. Otherwise, they are returned in the order
+        they were added.
+        """
+        size = ObjectIndex.BUCKET_SIZE
+        buckets = self.buckets
+        first_bucket_x, last_bucket_x = left / size, right / size + 1
+        entries = []
+        for y in xrange(top, bottom + 1):
+            for bucket_x in xrange(first_bucket_x, last_bucket_x):
+                bucket = buckets.get((bucket_x, y))
+                if bucket is not None:
+                    entries.extend(bucket)
+        if not depth_order:
+            entries.sort(key=itemgetter(1))
+        return [entry[2] for entry in entries]
+
+
+class PassabilityCache(dict):
+
+    """
+    A PassabilityCache maps the tile ids of a cell, as taken by
+    MapModel.compute_passability(), to its passability. Maps use few
+    combinations of tiles, so most cells are looked up instead of
+    computed.
+    """
+
+    def __init__(self, map_model):
+        dict.__init__(self)
+        self.map_model = map_model
+        self.tables = self.get_tables()
+
+    def get_tables(self):
+        # The attribute tables the values are computed from, which are
+        # replaced whenever a Tileset builds them again
+        map_model = self.map_model
+        layers = [map_model.terrain_layer] + map_model.scenario_layer
+        return [(layer.tileset.obstacles, layer.tileset.closed_directions)
+                for layer in layers]
+
+    def is_current(self):
+        """
+        Return whether the values were computed from the current
+        attribute tables of the map's Tilesets.
+        """
+        for (obstacles, closed), (current_obstacles, current_closed) in \
+            zip(self.tables, self.get_tables()):
+            if obstacles is not current_obstacles or \
+               closed is not current_closed:
+                return False
+        return True
+
+    def __missing__(self, ids):
+        value = self.map_model.compute_passability(ids)
+        self[ids] = value
+        return value
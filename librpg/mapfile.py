@@ -0,0 +1,263 @@
+"""
+The :mod:`mapfile` module reads map layouts, either from .map text files
+or from compiled maps, and compiles the former into the latter.
+
+A compiled map is a binary file that can be loaded without parsing. It
+starts with a header holding the map size, its number of layers and the
+tileset files of each layer, followed by the tile ids of each layer as
+an array of little-endian unsigned shorts in row-major order, terrain
+first. MapModel accepts either kind of file as its map file.
+
+The tileset files are stored relative to the directory of the compiled
+map, so that it can be moved together with them. In a MapLayout, as
+everywhere else, they are relative to the current directory.
+"""
+
+import os
+import csv
+import sys
+import mmap
+import struct
+from array import array
+
+MAGIC = 'LRPGCMAP'
+VERSION = 1
+EXTENSION = '.cmap'
+
+HEADER = struct.Struct('<8sIIII')
+STRING_HEADER = struct.Struct('<H')
+
+
+class MapLayout(object):
+
+    """
+    The tiles of a map, as read from its map file.
+
+    :attr:`width`
+        Map width.
+
+    :attr:`height`
+        Map height.
+
+    :attr:`layers`
+        List with the tile ids of each layer, the terrain first and then
+        the scenario layers, as array('H') in row-major order.
+
+    :attr:`tileset_files`
+        List with the (tileset image filename, tileset boundaries
+        filename) tuple of each layer, or None if the map file does not
+        reference its tilesets.
+    """
+
+    def __init__(self, width, height, layers, tileset_files=None):
+        self.width = width
+        self.height = height
+        self.layers = layers
+        self.tileset_files = tileset_files
+
+    def get_scenario_number(self):
+        """
+        Return how many scenario layers the map has.
+        """
+        return len(self.layers) - 1
+
+
+def is_compiled_map(filename):
+    """
+    Return whether *filename* is a compiled map.
+    """
+    f = open(filename, 'rb')
+    try:
+        return f.read(len(MAGIC)) == MAGIC
+    finally:
+        f.close()
+
+
+def load_map_file(filename):
+    """
+    Return the MapLayout read from *filename*, a compiled map or a .map
+    text file.
+    """
+    if is_compiled_map(filename):
+        return load_compiled_map(filename)
+    else:
+        return load_text_map(filename)
+
+
+def load_text_map(filename):
+    """
+    Return the MapLayout read from *filename*, a .map text file.
+    """
+    layout_file = open(filename)
+    try:
+        r = csv.reader(layout_file, delimiter=',')
+
+        first_line = r.next()
+        width = int(first_line[0])
+        height = int(first_line[1])
+        scenario_number = int(first_line[2])
+
+        layers = []
+        for i in xrange(scenario_number + 1):
+            ids = array('H', [0]) * (width * height)
+            y = 0
+            for line in r:
+                if len(line) == width:
+                    row = array('H', [int(value) for value in line])
+                    ids[y * width:(y + 1) * width] = row
+                    y += 1
+                if y >= height:
+                    break
+            layers.append(ids)
+    finally:
+        layout_file.close()
+    return MapLayout(width, height, layers)
+
+
+def load_compiled_map(filename):
+    """
+    Return the MapLayout read from *filename*, a compiled map. The file
+    is memory-mapped and its tile ids are copied as they are.
+
+    Raises ValueError if the file is not a compiled map.
+    """
+    return read_mapped(filename, read_compiled_map)
+
+
+def read_mapped(filename, reader):
+    # Call reader with the memory-mapped contents of filename
+    f = open(filename, 'rb')
+    try:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (EnvironmentError, ValueError):
+            data = f.read()
+        try:
+            return reader(data, filename)
+        finally:
+            if isinstance(data, mmap.mmap):
+                data.close()
+    finally:
+        f.close()
+
+
+def read_compiled_map(data, filename):
+    width, height, tileset_files, offset = read_header(data, filename)
+    size = width * height * 2
+    if len(data) != offset + len(tileset_files) * size:
+        raise ValueError('%s has the wrong size for its header' % filename)
+
+    layers = []
+    for i in xrange(len(tileset_files)):
+        ids = array('H')
+        ids.fromstring(buffer(data, offset, size))
+        if sys.byteorder == 'big':
+            ids.byteswap()
+        layers.append(ids)
+        offset += size
+    return MapLayout(width, height, layers, tileset_files)
+
+
+def read_header(data, filename):
+    if len(data) < HEADER.size:
+        raise ValueError('%s is not a compiled map' % filename)
+    magic, version, width, height, layer_number = HEADER.unpack(
+                                                    data[:HEADER.size])
+    if magic != MAGIC:
+        raise ValueError('%s is not a compiled map' % filename)
+    if version != VERSION:
+        raise ValueError('%s is a compiled map of version %d, expected %d'
+                         % (filename, version, VERSION))
+
+    offset = HEADER.size
+    strings = []
+    for i in xrange(layer_number * 2):
+        if len(data) < offset + STRING_HEADER.size:
+            raise ValueError('%s is truncated' % filename)
+        length, = STRING_HEADER.unpack(
+                            data[offset:offset + STRING_HEADER.size])
+        offset += STRING_HEADER.size
+        if len(data) < offset + length:
+            raise ValueError('%s is truncated' % filename)
+        strings.append(data[offset:offset + length])
+        offset += length
+    directory = os.path.dirname(filename)
+    paths = [os.path.normpath(os.path.join(directory, string))
+             for string in strings]
+    tileset_files = zip(paths[::2], paths[1::2])
+    return width, height, tileset_files, offset
+
+
+def get_tileset_files(filename):
+    """
+    Return the list of (tileset image filename, tileset boundaries
+    filename) tuples referenced by *filename*, a compiled map, the
+    terrain tileset first.
+
+    Raises ValueError if the file is not a compiled map.
+    """
+    return read_mapped(filename, read_header)[2]
+
+
+def save_compiled_map(layout, filename):
+    """
+    Write *layout*, a MapLayout with its tileset_files set, to
+    *filename* as a compiled map.
+    """
+    if layout.tileset_files is None:
+        raise ValueError('The tilesets of the layout are not known')
+    if len(layout.tileset_files) != len(layout.layers):
+        raise ValueError('The layout has %d layers but %d tilesets'
+                         % (len(layout.layers), len(layout.tileset_files)))
+
+    directory = os.path.dirname(os.path.abspath(filename))
+    f = open(filename, 'wb')
+    try:
+        f.write(HEADER.pack(MAGIC, VERSION, layout.width, layout.height,
+                            len(layout.layers)))
+        for tileset_file in layout.tileset_files:
+            for path in tileset_file:
+                string = get_relative_path(path, directory)
+                if isinstance(string, unicode):
+                    string = string.encode('utf-8')
+                f.write(STRING_HEADER.pack(len(string)))
+                f.write(string)
+        for ids in layout.layers:
+            if len(ids) != layout.width * layout.height:
+                raise ValueError('A layer has %d tiles instead of %d'
+                                 % (len(ids), layout.width * layout.height))
+            if sys.byteorder == 'big':
+                ids = array('H', ids)
+                ids.byteswap()
+            ids.tofile(f)
+    finally:
+        f.close()
+
+
+def get_relative_path(path, directory):
+    # Return path relative to directory, or absolute if it cannot be,
+    # such as when they are in different drives
+    path = os.path.abspath(path)
+    try:
+        return os.path.relpath(path, directory)
+    except ValueError:
+        return path
+
+
+def compile_map(map_file, terrain_tileset_files, scenario_tileset_files_list,
+                filename=None):
+    """
+    Compile *map_file*, a .map text file, whose layers use the tilesets
+    given by *terrain_tileset_files* and *scenario_tileset_files_list*,
+    as in the MapModel constructor. The compiled map is written to
+    *filename*, by default *map_file* with the extension changed to
+    .cmap, and its filename is returned.
+    """
+    layout = load_text_map(map_file)
+    layout.tileset_files = ([tuple(terrain_tileset_files)]
+                            + [tuple(files) for files
+                               in scenario_tileset_files_list])
+    if filename is None:
+        filename = os.path.splitext(map_file)[0] + EXTENSION
+    save_compiled_map(layout, filename)
+    return filename
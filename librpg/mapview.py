@@ -1,11 +1,16 @@
+import threading
+import Queue
+
 import pygame
 
 from librpg.config import graphics_config as g_cfg
 from librpg.tile import Tile
 from librpg.locals import UP, RIGHT, DOWN, LEFT, ANIMATION_PERIOD, SRCALPHA
 from librpg.color import BLACK
-from librpg.virtualscreen import get_screen
+from librpg.virtualscreen import (get_screen, prescale, unprescale,
+                                  surface_memory)
 from librpg.util import Position
+from librpg.layercache import LayerCache
 
 
 class MapView(object):
@@ -19,77 +24,395 @@ class MapView(object):
 
     background: Surface (private)
     Surface containing the static terrain and scenario layers that are
-    drawn at the lower level.
+    drawn at the lower level, with animated tiles in their first phase.
+    It covers only the map, which is placed at map_rect.
+
+    map_rect: Rect (private)
+    Area of the map in the layers, which have a border of half a screen
+    around it.
+
+    animated_rows: dict (private)
+    Maps each map line containing animated terrain tiles to a list of
+    (x, terrain Tile, [scenario Surfaces]) tuples, used to draw the
+    animated tiles over the background in their current phase.
 
-    foreground: Surface (private)
-    Surface containing the static scenario tiles that are drawn at
-    the upper level.
+    background_chunks: ChunkCache (private)
+    Cache of background chunks rendered on demand, used instead of
+    background when graphics_config.background_chunk_size is set.
+
+    foreground_chunks: dict (private)
+    Maps the coordinates, in chunks of FOREGROUND_CHUNK_SIZE tiles, of
+    each chunk containing scenario tiles that are drawn at the upper
+    level to a (topleft, Surface) tuple. The Surface covers only those
+    tiles, and topleft is its position in the background. Chunks without
+    such tiles are not stored. The layers are composed in blocks of the
+    same size, so each block has at most one foreground chunk.
+
+    above_ids: [set of int] (private)
+    Ids of the tiles drawn at the upper level in each scenario layer.
 
     camera_mode: CameraMode (private)
     CameraMode to calculate the map focus.
+
+    drawn_objects: dict (private)
+    Maps the objects drawn in the last frame to the (Surface, Rect) they
+    were drawn with, to report which regions changed when the screen
+    tracks dirty rects.
+
+    loader: MapViewLoader (private)
+    Thread composing the blocks of the background and foreground when
+    graphics_config.threaded_map_loading is set, None otherwise.
+
+    layer_cache: LayerCache (private)
+    Disk cache from which the background and foreground are loaded and
+    to which they are saved once composed, or None if
+    graphics_config.map_cache_dir is not set.
     """
 
+    FOREGROUND_CHUNK_SIZE = 8
+
     def __init__(self, map_model):
         self.map_model = map_model
+        self.map_rect = pygame.Rect((g_cfg.map_border_width,
+                                     g_cfg.map_border_height),
+                                    self.get_layer_size())
 
-        self.init_backgrounds()
-        self.init_foreground()
+        if g_cfg.background_chunk_size is None:
+            self.background_chunks = None
+        else:
+            self.init_background_chunks()
+        self.init_animated_tiles()
         self.camera_mode = g_cfg.camera_mode
         self.camera_mode.attach_to_map(self.map_model)
 
+        # Tiles beyond the screen in which drawn objects may be, due to
+        # their size or movement
+        self.object_margin = ((max(g_cfg.object_width, g_cfg.object_height)
+                               + g_cfg.tile_size - 1) / g_cfg.tile_size + 1)
+
         self.phase = 0
+        self.drawn_bg_topleft = None
+        self.drawn_phase = None
+        self.drawn_objects = {}
+
+        self.loader = None
+        if g_cfg.map_cache_dir is not None:
+            self.layer_cache = LayerCache(g_cfg.map_cache_dir)
+            self.layer_cache_key = self.layer_cache.get_key(self.map_model)
+        else:
+            self.layer_cache = None
+
+        if not self.load_cached_layers():
+            if self.background_chunks is None:
+                self.init_background()
+            self.init_foreground()
+            if g_cfg.threaded_map_loading:
+                self.loader = MapViewLoader(self)
+                self.loader.start()
+                return
+            for block in self.get_blocks():
+                background, foreground = self.compose_block(block)
+                self.add_block(block, background, foreground)
+            self.save_cached_layers()
+        self.prescale_layers()
+
+    def get_layer_size(self):
+        return (g_cfg.tile_size * self.map_model.width,
+                g_cfg.tile_size * self.map_model.height)
+
+    def init_background(self):
+        self.background = pygame.Surface(self.get_layer_size())
+        self.background.fill(BLACK)
+
+    def blit_background_tile(self, surface, x, y, dest):
+        index = y * self.map_model.width + x
+        terrain_layer = self.map_model.terrain_layer
+        terrain_tile = terrain_layer.tileset.tiles[terrain_layer.ids[index]]
+        surface.blit(terrain_tile.get_surface(), dest)
+
+        for layer in self.map_model.scenario_layer:
+            id = layer.ids[index]
+            if layer.tileset.obstacles[id] != Tile.ABOVE:
+                surface.blit(layer.tileset.tiles[id].get_surface(), dest)
+
+    def init_background_chunks(self):
+        chunk_size = g_cfg.background_chunk_size
+        self.chunk_pixel_size = chunk_size * g_cfg.tile_size
+        self.chunk_columns = ((self.map_model.width + chunk_size - 1)
+                              / chunk_size)
+        self.chunk_lines = ((self.map_model.height + chunk_size - 1)
+                            / chunk_size)
+        self.background_chunks = ChunkCache(self.render_background_chunk,
+                                            g_cfg.background_cache_size)
+
+    def render_background_chunk(self, key):
+        chunk_x, chunk_y = key
+        chunk_size = g_cfg.background_chunk_size
+        first_x, first_y = chunk_x * chunk_size, chunk_y * chunk_size
+        last_x = min(first_x + chunk_size, self.map_model.width)
+        last_y = min(first_y + chunk_size, self.map_model.height)
+        chunk = self.compose_background(first_x, first_y, last_x, last_y)
+        prescale(chunk)
+        return chunk
+
+    def compose_background(self, first_x, first_y, last_x, last_y):
+        """
+        Return a new Surface with the background tiles from
+        (first_x, first_y) up to, but not including, (last_x, last_y).
+        """
+        tile_size = g_cfg.tile_size
+        surface = pygame.Surface(((last_x - first_x) * tile_size,
+                                  (last_y - first_y) * tile_size))
+        for y in xrange(first_y, last_y):
+            for x in xrange(first_x, last_x):
+                dest = ((x - first_x) * tile_size, (y - first_y) * tile_size)
+                self.blit_background_tile(surface, x, y, dest)
+        return surface
 
-    def init_backgrounds(self):
-        self.backgrounds = []
-        for animation_phase in xrange(ANIMATION_PERIOD):
-            self.backgrounds.append(self.init_background(animation_phase))
+    def draw_background(self, bg_rect):
+        screen = get_screen()
+        if not self.map_rect.contains(bg_rect):
+            screen.fill(BLACK)
 
-    def init_background(self, animation_phase):
-        background_width = (g_cfg.tile_size * self.map_model.width +
-                            g_cfg.screen_width)
-        background_height = (g_cfg.tile_size * self.map_model.height +
-                             g_cfg.screen_height)
-        background = pygame.Surface((background_width, background_height))
+        visible = bg_rect.clip(self.map_rect)
+        if not visible.width or not visible.height:
+            return
 
-        background.fill(BLACK)
+        if self.background_chunks is None:
+            screen.blit(self.background,
+                        (visible.left - bg_rect.left,
+                         visible.top - bg_rect.top),
+                        visible.move(-self.map_rect.left,
+                                     -self.map_rect.top))
+        else:
+            self.draw_background_chunks(bg_rect, visible)
+
+    def draw_background_chunks(self, bg_rect, visible):
+        screen = get_screen()
+        size = self.chunk_pixel_size
+        first_x = (visible.left - self.map_rect.left) / size
+        last_x = (visible.right - 1 - self.map_rect.left) / size
+        first_y = (visible.top - self.map_rect.top) / size
+        last_y = (visible.bottom - 1 - self.map_rect.top) / size
+        get_chunk = self.background_chunks.get
+        for chunk_y in xrange(first_y, last_y + 1):
+            dest_y = self.map_rect.top + chunk_y * size - bg_rect.top
+            for chunk_x in xrange(first_x, last_x + 1):
+                dest_x = self.map_rect.left + chunk_x * size - bg_rect.left
+                chunk = get_chunk((chunk_x, chunk_y))
+                screen.blit(chunk, (dest_x, dest_y))
 
+    def init_animated_tiles(self):
+        self.animated_rows = {}
+        width = self.map_model.width
+        terrain_layer = self.map_model.terrain_layer
+        terrain_tiles = terrain_layer.tileset.tiles
+        animated_ids = set([tile.id for tile in terrain_tiles
+                            if tile.image.phases > 1])
+        if not animated_ids:
+            return
         for y in xrange(self.map_model.height):
-            for x in xrange(self.map_model.width):
-                bg_x = (g_cfg.map_border_width
-                        + x * g_cfg.tile_size)
-                bg_y = (g_cfg.map_border_height
-                        + y * g_cfg.tile_size)
-                terrain_tile_surface = self.map_model.terrain_layer[x, y].\
-                                       get_surface(animation_phase)
-                background.blit(terrain_tile_surface, (bg_x, bg_y))
-
-                for i in range(self.map_model.scenario_number):
-                    scenario_tile = self.map_model.scenario_layer[i][x, y]
-                    if scenario_tile.obstacle != Tile.ABOVE:
-                        scenario_tile_surface = scenario_tile.get_surface()
-                        background.blit(scenario_tile_surface, (bg_x, bg_y))
-        return background
+            row = []
+            for x in xrange(width):
+                index = y * width + x
+                terrain_id = terrain_layer.ids[index]
+                if terrain_id in animated_ids:
+                    scenario_surfaces = []
+                    for layer in self.map_model.scenario_layer:
+                        id = layer.ids[index]
+                        if layer.tileset.obstacles[id] != Tile.ABOVE:
+                            scenario_surfaces.append(
+                                layer.tileset.tiles[id].get_surface())
+                    row.append((x, terrain_tiles[terrain_id],
+                                scenario_surfaces))
+            if row:
+                self.animated_rows[y] = row
+
+    def draw_animated_tiles(self, bg_rect, animation_phase,
+                            mark_dirty=False):
+        if not self.animated_rows:
+            return
+
+        tile_size = g_cfg.tile_size
+        left = bg_rect.left - g_cfg.map_border_width
+        top = bg_rect.top - g_cfg.map_border_height
+        first_x = left / tile_size
+        last_x = (left + bg_rect.width - 1) / tile_size
+        first_y = top / tile_size
+        last_y = (top + bg_rect.height - 1) / tile_size
+
+        screen = get_screen()
+        for y in xrange(max(first_y, 0), last_y + 1):
+            row = self.animated_rows.get(y)
+            if row is None:
+                continue
+            dest_y = y * tile_size - top
+            for x, terrain_tile, scenario_surfaces in row:
+                if x < first_x or x > last_x:
+                    continue
+                dest = (x * tile_size - left, dest_y)
+                if mark_dirty:
+                    screen.mark_dirty((dest, (tile_size, tile_size)))
+                image = terrain_tile.image
+                if not animation_phase % image.phases:
+                    # First phase, already in the background
+                    continue
+                screen.fill(BLACK, (dest, (tile_size, tile_size)))
+                screen.blit(image.get_surface(animation_phase=animation_phase),
+                            dest)
+                for scenario_surface in scenario_surfaces:
+                    screen.blit(scenario_surface, dest)
 
     def init_foreground(self):
-        foreground_width = (g_cfg.tile_size * self.map_model.width
-                            + g_cfg.screen_width)
-        foreground_height = (g_cfg.tile_size * self.map_model.height
-                             + g_cfg.screen_height)
-        self.foreground = pygame.Surface((foreground_width, foreground_height),
-                                         SRCALPHA, 32)
+        self.foreground_chunks = {}
+        self.above_ids = []
+        for layer in self.map_model.scenario_layer:
+            obstacles = layer.tileset.obstacles
+            self.above_ids.append(set([id for id in xrange(layer.tileset.size)
+                                       if obstacles[id] == Tile.ABOVE]))
 
-        for y in xrange(self.map_model.height):
-            for x in xrange(self.map_model.width):
-                for i in range(self.map_model.scenario_number):
-                    scenario_tile = self.map_model.scenario_layer[i][x, y]
-                    if scenario_tile.obstacle == Tile.ABOVE:
-                        fg_x = (g_cfg.map_border_width
-                                + x * g_cfg.tile_size)
-                        fg_y = (g_cfg.map_border_height
-                                + y * g_cfg.tile_size)
-                        scenario_tile_surface = scenario_tile.get_surface()
-                        self.foreground.blit(scenario_tile_surface,
-                                             (fg_x, fg_y))
+    def get_blocks(self):
+        """
+        Return the coordinates of all blocks of FOREGROUND_CHUNK_SIZE tiles
+        in which the layers are composed.
+        """
+        size = MapView.FOREGROUND_CHUNK_SIZE
+        columns = (self.map_model.width + size - 1) / size
+        lines = (self.map_model.height + size - 1) / size
+        return [(x, y) for y in xrange(lines) for x in xrange(columns)]
+
+    def compose_block(self, block):
+        """
+        Compose the tiles of *block* into new Surfaces and return them in
+        a (background, foreground) tuple. background is None if the
+        background is split in chunks, and foreground is a (topleft,
+        Surface) tuple as in foreground_chunks, or None if the block has
+        no tiles drawn at the upper level.
+
+        Only the map is read and the MapView is not changed, so blocks
+        can be composed in a separate thread. add_block() puts them in
+        place.
+        """
+        size = MapView.FOREGROUND_CHUNK_SIZE
+        width = self.map_model.width
+        first_x, first_y = block[0] * size, block[1] * size
+        last_x = min(first_x + size, width)
+        last_y = min(first_y + size, self.map_model.height)
+
+        if self.background_chunks is None:
+            background = self.compose_background(first_x, first_y,
+                                                 last_x, last_y)
+        else:
+            background = None
+
+        # Find the tiles drawn at the upper level and their bounds
+        above_tiles = []
+        for layer, above_ids in zip(self.map_model.scenario_layer,
+                                    self.above_ids):
+            if not above_ids:
+                continue
+            ids = layer.ids
+            tiles = layer.tileset.tiles
+            for y in xrange(first_y, last_y):
+                row = y * width
+                for x in xrange(first_x, last_x):
+                    id = ids[row + x]
+                    if id in above_ids:
+                        above_tiles.append((x, y, tiles[id]))
+        if not above_tiles:
+            return background, None
+        left = min([x for x, y, tile in above_tiles])
+        top = min([y for x, y, tile in above_tiles])
+        right = max([x for x, y, tile in above_tiles])
+        bottom = max([y for x, y, tile in above_tiles])
+
+        tile_size = g_cfg.tile_size
+        topleft = (g_cfg.map_border_width + left * tile_size,
+                   g_cfg.map_border_height + top * tile_size)
+        surface = pygame.Surface(((right - left + 1) * tile_size,
+                                  (bottom - top + 1) * tile_size),
+                                 SRCALPHA, 32)
+        for x, y, tile in above_tiles:
+            surface.blit(tile.get_surface(),
+                         ((x - left) * tile_size, (y - top) * tile_size))
+        return background, (topleft, surface)
+
+    def add_block(self, block, background, foreground):
+        """
+        Put the Surfaces composed by compose_block() for *block* in place.
+        """
+        if background is not None:
+            size = MapView.FOREGROUND_CHUNK_SIZE * g_cfg.tile_size
+            self.background.blit(background,
+                                 (block[0] * size, block[1] * size))
+        if foreground is not None:
+            self.foreground_chunks[block] = foreground
+
+    def prescale_layers(self):
+        if self.background_chunks is None:
+            prescale(self.background)
+        for topleft, chunk in self.foreground_chunks.itervalues():
+            prescale(chunk)
+
+    def load_cached_layers(self):
+        """
+        Load the background, unless it is split in chunks, and the
+        foreground from the layer cache. Return whether they were there.
+        """
+        if self.layer_cache is None:
+            return False
+        key = self.layer_cache_key
+        if self.background_chunks is None:
+            background = self.layer_cache.load(key, 'background', False)
+            if (background is None or len(background) != 1
+                or background[0][1].get_size() != self.get_layer_size()):
+                return False
+        foreground = self.layer_cache.load(key, 'foreground', True)
+        if foreground is None:
+            return False
+
+        if self.background_chunks is None:
+            self.background = background[0][1]
+        # The chunks are stored with their position on the map, without
+        # the border, which depends on the screen size
+        size = MapView.FOREGROUND_CHUNK_SIZE * g_cfg.tile_size
+        self.foreground_chunks = {}
+        for (x, y), chunk in foreground:
+            topleft = (self.map_rect.left + x, self.map_rect.top + y)
+            self.foreground_chunks[x / size, y / size] = (topleft, chunk)
+        return True
+
+    def save_cached_layers(self):
+        """
+        Save the composed layers to the layer cache, if there is one.
+        """
+        if self.layer_cache is None:
+            return
+        key = self.layer_cache_key
+        if self.background_chunks is None:
+            self.layer_cache.save(key, 'background',
+                                  [((0, 0), self.background)], False)
+        left, top = self.map_rect.topleft
+        foreground = [((x - left, y - top), chunk) for (x, y), chunk
+                      in self.foreground_chunks.itervalues()]
+        self.layer_cache.save(key, 'foreground', foreground, True)
+
+    def get_ready(self):
+        return self.loader is None or self.loader.is_ready()
+
+    ready = property(get_ready)
+    """
+    Whether the area around the party has been composed, so the map can
+    be shown.
+    """
+
+    def destroy(self):
+        """
+        Stop composing the layers, if they are still being composed in a
+        separate thread.
+        """
+        if self.loader is not None:
+            self.loader.stop()
 
     def draw(self):
         party_avatar = self.map_model.party_avatar
@@ -107,26 +430,77 @@ class MapView(object):
                                                             party_x_offset,
                                                             party_y_offset)
         bg_rect = pygame.Rect(self.bg_topleft, g_cfg.screen_dimensions)
+        if self.loader is not None and not self.loader.finished:
+            tile_size = g_cfg.tile_size
+            self.loader.wait_for_area(
+                (bg_rect.left - g_cfg.map_border_width) / tile_size,
+                (bg_rect.top - g_cfg.map_border_height) / tile_size,
+                (bg_rect.right - g_cfg.map_border_width - 1) / tile_size,
+                (bg_rect.bottom - g_cfg.map_border_height - 1) / tile_size)
         phase = self.phase / g_cfg.animation_frame_period
-        get_screen().blit(self.backgrounds[phase], (0, 0), bg_rect)
+        screen = get_screen()
+        if screen.dirty_rects:
+            if self.bg_topleft != self.drawn_bg_topleft:
+                screen.mark_all_dirty()
+            mark_animated_tiles = phase != self.drawn_phase
+            self.drawn_bg_topleft = self.bg_topleft
+            self.drawn_phase = phase
+            drawn_objects = {}
+        else:
+            mark_animated_tiles = False
+            drawn_objects = None
+
+        self.draw_background(bg_rect)
+        self.draw_animated_tiles(bg_rect, phase, mark_animated_tiles)
 
         # Draw the map objects
-        self.draw_object_layer(self.map_model.below_objects)
-        self.draw_object_layer(self.map_model.obstacle_objects)
-        self.draw_object_layer(self.map_model.above_objects)
+        tile_size = g_cfg.tile_size
+        left = ((bg_rect.left - g_cfg.map_border_width) / tile_size
+                - self.object_margin)
+        top = ((bg_rect.top - g_cfg.map_border_height) / tile_size
+               - self.object_margin)
+        right = ((bg_rect.right - g_cfg.map_border_width) / tile_size
+                 + self.object_margin)
+        bottom = ((bg_rect.bottom - g_cfg.map_border_height) / tile_size
+                  + self.object_margin)
+        depth_order = (g_cfg.object_width > tile_size or
+                       g_cfg.object_height > tile_size)
+        for object_index in (self.map_model.below_index,
+                             self.map_model.obstacle_index,
+                             self.map_model.above_index):
+            self.draw_object_layer(object_index.query(left, top, right,
+                                                      bottom, depth_order),
+                                   drawn_objects)
+        if drawn_objects is not None:
+            self.mark_changed_objects(drawn_objects)
 
         # Draw the foreground
-        get_screen().blit(self.foreground, (0, 0), bg_rect)
+        if self.foreground_chunks:
+            self.draw_foreground_chunks(bg_rect)
 
         # Update phase
         self.phase = (self.phase + 1) % (ANIMATION_PERIOD
                                        * g_cfg.animation_frame_period)
 
-    def draw_object_layer(self, object_layer):
-        if g_cfg.object_width > g_cfg.tile_size or\
-           g_cfg.object_height > g_cfg.tile_size:
-            object_layer.sort(key=lambda x: x.position)
+    def draw_foreground_chunks(self, bg_rect):
+        screen = get_screen()
+        chunk_pixel_size = MapView.FOREGROUND_CHUNK_SIZE * g_cfg.tile_size
+        first_x = (bg_rect.left - g_cfg.map_border_width) / chunk_pixel_size
+        first_y = (bg_rect.top - g_cfg.map_border_height) / chunk_pixel_size
+        last_x = ((bg_rect.right - 1 - g_cfg.map_border_width)
+                  / chunk_pixel_size)
+        last_y = ((bg_rect.bottom - 1 - g_cfg.map_border_height)
+                  / chunk_pixel_size)
+        for chunk_y in xrange(first_y, last_y + 1):
+            for chunk_x in xrange(first_x, last_x + 1):
+                try:
+                    topleft, chunk = self.foreground_chunks[chunk_x, chunk_y]
+                except KeyError:
+                    continue
+                screen.blit(chunk, (topleft[0] - bg_rect.left,
+                                    topleft[1] - bg_rect.top))
 
+    def draw_object_layer(self, object_layer, drawn_objects=None):
         for obj in object_layer:
             obj_x_offset, obj_y_offset = self.calc_object_movement_offset(obj)
             obj_topleft = self.camera_mode.\
@@ -135,7 +509,24 @@ class MapView(object):
                                         obj_x_offset, obj_y_offset)
             obj_rect = pygame.Rect(obj_topleft,
                                    g_cfg.object_dimensions)
-            get_screen().blit(obj.get_surface(), obj_rect)
+            obj_surface = obj.get_surface()
+            get_screen().blit(obj_surface, obj_rect)
+            if drawn_objects is not None:
+                drawn_objects[obj] = (obj_surface, obj_rect)
+
+    def mark_changed_objects(self, drawn_objects):
+        screen = get_screen()
+        previous = self.drawn_objects
+        for obj, (surface, rect) in drawn_objects.iteritems():
+            old = previous.pop(obj, None)
+            if old is None:
+                screen.mark_dirty(rect)
+            elif old[0] is not surface or old[1] != rect:
+                screen.mark_dirty(old[1])
+                screen.mark_dirty(rect)
+        for surface, rect in previous.itervalues():
+            screen.mark_dirty(rect)
+        self.drawn_objects = drawn_objects
 
     def calc_object_movement_offset(self, obj):
         obj_x_offset, obj_y_offset = 0, 0
@@ -168,3 +559,216 @@ class MapView(object):
         y = int((scr_y + self.bg_topleft[1] - g_cfg.map_border_height)
                 / g_cfg.tile_size)
         return x, y
+
+    def get_surface_memory(self):
+        """
+        Return how many bytes the rendered map layers currently take,
+        counting their prescaled copies.
+        """
+        if self.background_chunks is None:
+            layers = [self.background]
+        else:
+            layers = self.background_chunks.chunks.values()
+        for topleft, chunk in self.foreground_chunks.itervalues():
+            layers.append(chunk)
+        return sum([surface_memory(layer) for layer in layers])
+
+
+class MapViewLoader(threading.Thread):
+
+    """
+    A thread that composes the layers of a MapView block by block, the
+    blocks closest to the party first.
+
+    The thread only reads the map and composes each block into new
+    Surfaces, which it hands over through a queue. They are put in place
+    in the MapView by receive(), is_ready() and wait_for_area(), which
+    are called from the main thread, so the thread never changes the
+    Surfaces being drawn.
+
+    map_view: MapView (read-only)
+    MapView whose layers are composed.
+
+    blocks: [(int, int)] (read-only)
+    Coordinates, in blocks, of all blocks in the order they are composed.
+
+    ready_blocks: set of (int, int) (read-only)
+    Blocks around the party that have to be in place before the map can
+    be shown.
+
+    done: set of (int, int) (read-only)
+    Blocks already put in place.
+
+    finished: bool (read-only)
+    Whether all blocks composed were put in place and the thread is done,
+    after composing all blocks or being stopped.
+
+    queue: Queue (private)
+    Composed blocks as (block, background, foreground) tuples, as
+    returned by MapView.compose_block(), followed by None once the
+    thread is done.
+    """
+
+    def __init__(self, map_view):
+        threading.Thread.__init__(self)
+        self.setDaemon(True)
+        self.map_view = map_view
+        self.queue = Queue.Queue()
+        self.done = set()
+        self.finished = False
+        self.stopped = False
+        self.ready = False
+
+        map_model = map_view.map_model
+        if map_model.party_avatar is not None:
+            center_x, center_y = map_model.party_avatar.position
+        else:
+            center_x, center_y = 0, 0
+        size = MapView.FOREGROUND_CHUNK_SIZE
+        center_x, center_y = center_x / size, center_y / size
+        self.blocks = map_view.get_blocks()
+        self.blocks.sort(key=lambda block: ((block[0] - center_x) ** 2
+                                            + (block[1] - center_y) ** 2))
+
+        # The party may be anywhere on the screen, so the screen around it
+        # in every direction has to be ready
+        tile_size = g_cfg.tile_size
+        reach_x = (g_cfg.screen_width / tile_size + map_view.object_margin
+                   + size - 1) / size
+        reach_y = (g_cfg.screen_height / tile_size + map_view.object_margin
+                   + size - 1) / size
+        self.ready_blocks = set([(x, y) for x, y in self.blocks
+                                 if abs(x - center_x) <= reach_x
+                                 and abs(y - center_y) <= reach_y])
+
+    def run(self):
+        try:
+            for block in self.blocks:
+                if self.stopped:
+                    return
+                background, foreground = self.map_view.compose_block(block)
+                self.queue.put((block, background, foreground))
+        finally:
+            self.queue.put(None)
+
+    def stop(self):
+        """
+        Stop composing blocks. The blocks not composed yet will be left
+        blank.
+        """
+        self.stopped = True
+
+    def receive(self, needed=()):
+        """
+        Put the blocks composed so far in place, waiting for the blocks in
+        *needed* to be composed if they were not yet. Once all blocks are
+        in place, the layers are saved to the layer cache and prescaled.
+
+        This should only be called from the main thread.
+        """
+        while not self.finished:
+            wait = not self.done.issuperset(needed)
+            try:
+                composed = self.queue.get(wait)
+            except Queue.Empty:
+                return
+            if composed is None:
+                self.finished = True
+                if not self.stopped:
+                    self.map_view.save_cached_layers()
+                self.map_view.prescale_layers()
+            else:
+                block, background, foreground = composed
+                self.map_view.add_block(block, background, foreground)
+                self.done.add(block)
+
+    def is_ready(self):
+        """
+        Return whether all blocks in *ready_blocks* are in place.
+        """
+        if not self.ready:
+            self.receive()
+            self.ready = (self.finished
+                          or self.ready_blocks.issubset(self.done))
+        return self.ready
+
+    def wait_for_area(self, left, top, right, bottom):
+        """
+        Put the blocks composed so far in place, blocking until all blocks
+        covering the tiles from (left, top) to (right, bottom), inclusive,
+        are.
+        """
+        size = MapView.FOREGROUND_CHUNK_SIZE
+        map_model = self.map_view.map_model
+        left, top = max(left, 0) / size, max(top, 0) / size
+        right = min(right, map_model.width - 1) / size
+        bottom = min(bottom, map_model.height - 1) / size
+        needed = [(x, y) for y in xrange(top, bottom + 1)
+                  for x in xrange(left, right + 1)]
+        self.receive(needed)
+
+
+class ChunkCache(object):
+
+    """
+    A cache of rendered map chunks that keeps them within a memory budget,
+    discarding the least recently used ones first.
+
+    render: function (read-only)
+    Function that takes a chunk key and returns the Surface for it.
+
+    max_bytes: int (read-only)
+    Memory budget for the cached Surfaces, in bytes. The most recently
+    used chunk is always kept, even if it alone exceeds the budget.
+
+    bytes: int (read-only)
+    Memory currently taken by the cached Surfaces, in bytes, including
+    their prescaled copies.
+    """
+
+    def __init__(self, render, max_bytes):
+        self.render = render
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.chunks = {}
+        self.sizes = {}
+        self.last_used = {}
+        self.clock = 0
+
+    def get(self, key):
+        """
+        Return the chunk Surface for *key*, rendering it if it is not
+        cached.
+        """
+        self.clock += 1
+        self.last_used[key] = self.clock
+        try:
+            return self.chunks[key]
+        except KeyError:
+            chunk = self.render(key)
+            self.chunks[key] = chunk
+            self.sizes[key] = surface_memory(chunk)
+            self.bytes += self.sizes[key]
+            self.shrink()
+            return chunk
+
+    def shrink(self):
+        while self.bytes > self.max_bytes and len(self.chunks) > 1:
+            key = min(self.last_used, key=self.last_used.get)
+            self.discard(key)
+
+    def discard(self, key):
+        unprescale(self.chunks.pop(key))
+        del self.last_used[key]
+        self.bytes -= self.sizes.pop(key)
+
+    def clear(self):
+        """
+        Discard all cached chunks.
+        """
+        for chunk in self.chunks.itervalues():
+            unprescale(chunk)
+        self.chunks.clear()
+        self.sizes.clear()
+        self.last_used.clear()
+        self.bytes = 0
@@ -92,7 +92,7 @@ class Cursor(object):
             return True
 
     def render(self, screen):
-        screen.blit(self.image.get_surface(), self.target_pos)
+        return screen.blit(self.image.get_surface(), self.target_pos)
 
 
 class HighlightCursor(Cursor):
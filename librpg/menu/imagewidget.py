@@ -36,6 +36,8 @@ class ImageWidget(Widget):
         self._surf = surf
         self.changed = True
         self.draw()
+        if self.menu is not None:
+            self.menu.mark_changed(self.get_menu_rect())
 
     surf = property(get_surf, set_surf)
     """
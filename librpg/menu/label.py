@@ -54,7 +54,8 @@ class Label(Widget):
     def __draw_one_line(self, font):
         self.image = Image(font.render(self._text,
                                        self.theme.get_font_anti_alias(),
-                                       self.color))
+                                       self.color),
+                           static=True)
         
     def __draw_multi_line(self, font):
         lines = build_lines(self.text, self.max_width, font)
@@ -74,7 +75,7 @@ class Label(Widget):
 
             s.blit(line_surface, (x, y))
             y += h
-        self.image = Image(s)
+        self.image = Image(s, static=True)
 
     def __repr__(self):
         return "Label('%s')" % self._text
@@ -60,6 +60,8 @@ class Menu(Model, Div):
         self.blocking = blocking
 
         self.should_close = False
+        self.drawn = []
+        self.changed_rects = []
 
     def init_bg(self, bg):
         if bg is not None:
@@ -69,19 +71,50 @@ class Menu(Model, Div):
                 bg_surf.fill(bg)
             else:
                 fill_with_surface(bg_surf, bg)
-            self.bg = Image(bg_surf)
+            self.bg = Image(bg_surf, static=True)
         else:
             r = pygame.Rect(0, 0, self.width, self.height)
             self.bg = self.theme.draw_menu_bg(r)
 
     def draw(self):
         scr = get_screen()
-        scr.blit(self.bg.get_surface(), (self.x, self.y))
+        if scr.dirty_rects:
+            target = RenderLog(scr)
+        else:
+            target = scr
+        target.blit(self.bg.get_surface(), (self.x, self.y))
         Div.draw(self)
-        Div.render(self, scr, self.x, self.y)
+        Div.render(self, target, self.x, self.y)
         if self.cursor is not None:
             self.cursor.draw()
-            self.cursor.render(scr)
+            self.cursor.render(target)
+        if scr.dirty_rects:
+            self.report_changes(scr, target.operations)
+
+    def report_changes(self, scr, operations):
+        # Widgets replace their images when they change, so only what was
+        # not drawn the same way as in the last frame is reported
+        drawn = self.drawn
+        for i, operation in enumerate(operations):
+            if i >= len(drawn):
+                scr.mark_dirty(operation[1])
+            elif operation != drawn[i]:
+                scr.mark_dirty(operation[1])
+                scr.mark_dirty(drawn[i][1])
+        for operation in drawn[len(operations):]:
+            scr.mark_dirty(operation[1])
+        for rect in self.changed_rects:
+            scr.mark_dirty(rect.move(self.x, self.y))
+        self.drawn = operations
+        self.changed_rects = []
+
+    def mark_changed(self, rect):
+        """
+        Report that what is drawn in *rect*, relative to the menu's top
+        left, changed although the same surfaces were blitted there, as
+        when a surface is changed in place.
+        """
+        self.changed_rects.append(pygame.Rect(rect))
 
     # Use cursor.bind instead
     def add_cursor(self, cursor):
@@ -164,10 +197,42 @@ class Menu(Model, Div):
             cursor.move_to(best[0])
 
 
+class RenderLog(object):
+
+    """
+    A RenderLog stands for the screen while a Menu renders itself. It
+    passes blit() and fill() on to the *screen*, keeping an operation
+    for each in :attr:`operations`: a tuple with what was drawn and the
+    rect it covered on the screen, which compares equal when the same
+    thing is drawn at the same place again.
+    """
+
+    def __init__(self, screen):
+        self.screen = screen
+        self.operations = []
+
+    def blit(self, source, dest, area=None, special_flags=0):
+        rect = self.screen.blit(source, dest, area, special_flags)
+        if area is not None:
+            area = tuple(pygame.Rect(area))
+        self.operations.append((source, tuple(rect), area, special_flags))
+        return rect
+
+    def fill(self, color, rect=None, special_flags=0):
+        filled = self.screen.fill(color, rect, special_flags)
+        self.operations.append((None, tuple(filled), color, special_flags))
+        return filled
+
+    def __getattr__(self, name):
+        return getattr(self.screen, name)
+
+
 class MenuController(Context):
 
     COMMAND_COOLDOWN = 5
 
+    reports_dirty_rects = True
+
     def __init__(self, menu, parent=None):
         assert menu is not None, 'menu cannot be None'
         Context.__init__(self, parent)
@@ -177,6 +242,11 @@ class MenuController(Context):
         self.command_cooldown = 0
         self.done = False
 
+    def get_blocking(self):
+        return self.menu.blocking
+
+    blocking = property(get_blocking)
+
     def draw(self):
         self.menu.draw()
 
@@ -126,7 +126,7 @@ class VerticalScrollArea(Div):
             #surf.blit(self.scroll_area_img.get_surface(), (0, 0))
             surf.blit(self.scroll_bar_img,
                             (r.w, 0))
-            self.image = Image(surf)
+            self.image = Image(surf, static=True)
             self.changed = False
         Div.draw(self)
         
@@ -2,7 +2,7 @@ import pygame
 from pygame.locals import SRCALPHA
 
 from librpg.path import cursor_theme_path
-from librpg.image import Image
+from librpg.image import Image, load_image
 from librpg.animation import AnimatedImage
 from librpg.color import (transparency, WHITE, DARK_RED, PURPLE,
                           DARKER_MAGENTA, TRANSPARENT, BLUE)
@@ -150,13 +150,13 @@ class DefaultMenuTheme(MenuTheme):
         DEFAULT_COLOR = transparency(PURPLE, 0.5)
         surface = pygame.Surface((rect.width, rect.height), SRCALPHA, 32)
         pygame.draw.rect(surface, DEFAULT_COLOR, rect)
-        return Image(surface)
+        return Image(surface, static=True)
 
     def draw_scroll_area(self, rect):
         DEFAULT_COLOR = transparency(DARK_RED, 0.5)
         surface = pygame.Surface((rect.width, rect.height), SRCALPHA, 32)
         pygame.draw.rect(surface, DEFAULT_COLOR, rect)
-        return Image(surface)
+        return Image(surface, static=True)
 
     def draw_selected_tab(self, rect):
         DEFAULT_COLOR = transparency(PURPLE, 0.5)
@@ -169,7 +169,7 @@ class DefaultMenuTheme(MenuTheme):
             surface = pygame.Surface((rect.width, rect.height), SRCALPHA, 32)
             pygame.draw.rect(surface, DEFAULT_COLOR, internal_rect)
             surfaces.append(surface)
-        return AnimatedImage(surfaces, 10)
+        return AnimatedImage(surfaces, 10, static=True)
 
     def draw_unselected_tab(self, rect):
         DEFAULT_COLOR = transparency(DARKER_MAGENTA, 0.5)
@@ -178,7 +178,7 @@ class DefaultMenuTheme(MenuTheme):
                                     (rect.w - 2 * border, rect.h - border))
         surface = pygame.Surface((rect.width, rect.height), SRCALPHA, 32)
         pygame.draw.rect(surface, DEFAULT_COLOR, internal_rect)
-        return Image(surface)
+        return Image(surface, static=True)
 
     def draw_bar(self, rect, filled=1.0):
         surface = pygame.Surface((rect.width, rect.height), SRCALPHA, 32)
@@ -203,7 +203,7 @@ class DefaultMenuTheme(MenuTheme):
                              (rect.left + i + border,
                               rect.bottom - 1 - border),
                              1)
-        return Image(surface)
+        return Image(surface, static=True)
 
     def draw_scroll_bar(self, height, start, end, total):
         WIDTH = 12
@@ -270,7 +270,7 @@ class DefaultCursorTheme(CursorTheme):
                               target_rect.h + 2 * self.vertical_offset + 1)))
             frames.append(s)
 
-        return AnimatedImage(frames, self.animation_period), \
+        return AnimatedImage(frames, self.animation_period, static=True), \
                (target_rect.left - self.border - self.horizontal_offset,
                 target_rect.top - self.border - self.vertical_offset)
 
@@ -290,7 +290,7 @@ class PictureCursorTheme(CursorTheme):
         self.filename = filename
         self.x_offset = x_offset
         self.y_offset = y_offset
-        self.image = Image(pygame.image.load(self.filename))
+        self.image = Image(load_image(self.filename), static=True)
 
     def draw_cursor(self, target_rect):
         center_x = target_rect.left + self.x_offset
@@ -0,0 +1,394 @@
+"""
+The :mod:`profiling` module measures how long each part of the gameloop
+takes, to find out which Contexts are using the frame time.
+
+Profiling is off by default and costs next to nothing then. Once enabled with
+enable_profiling(), the ContextStack records the wall time of every
+Context's update() and draw(), of the input processing and of the
+screen flip, which can be read through the global ContextProfiler or
+shown on the screen by stacking a ProfilerOverlay.
+
+Similarly, enable_recording() makes the ContextStack log every frame
+to a FrameRecorder, which can be saved to a file and loaded again with
+load_frames() to compare runs frame by frame.
+"""
+
+import csv
+import struct
+
+import pygame
+
+from librpg.context import Context, get_context_stack
+from librpg.virtualscreen import get_screen
+from librpg.color import BLACK, WHITE
+
+PERCENTILES = (50, 90, 99)
+
+FRAME_FIELDS = ('timestamp', 'tick', 'busy', 'updated', 'drawn', 'map_id')
+FRAME_LOG_MAGIC = 'LRPGFRAM'
+FRAME_LOG_VERSION = 1
+FRAME_LOG_HEADER = struct.Struct('<8sIII')
+FRAME_RECORD = struct.Struct('<dffHHH')
+NO_MAP = 0xffff
+
+
+class ContextProfiler(object):
+
+    """
+    A ContextProfiler keeps the most recent timings recorded under each
+    name and computes percentiles of them.
+
+    Contexts are recorded as "<ClassName>.update" and "<ClassName>.draw",
+    and the rest of the gameloop as "input", "flip" and "frame", the
+    latter being the whole cycle except for the time spent waiting to
+    cap the FPS.
+
+    :attr:`window`
+        How many of the most recent timings are kept for each name.
+    """
+
+    def __init__(self, window=300):
+        self.window = window
+        self.samples = {}
+        self.positions = {}
+
+    def record(self, name, seconds):
+        """
+        Add a timing of *seconds* under *name*.
+        """
+        samples = self.samples.get(name)
+        if samples is None:
+            self.samples[name] = [seconds]
+        elif len(samples) < self.window:
+            samples.append(seconds)
+        else:
+            # Overwrite the oldest timing
+            position = self.positions.get(name, 0)
+            samples[position] = seconds
+            self.positions[name] = (position + 1) % self.window
+
+    def reset(self):
+        """
+        Discard all timings recorded so far.
+        """
+        self.samples = {}
+        self.positions = {}
+
+    def get_names(self):
+        """
+        Return a sorted list of the names with timings recorded.
+        """
+        return sorted(self.samples.keys())
+
+    def get_percentile(self, name, p):
+        """
+        Return the *p*-th percentile, in seconds, of the timings recorded
+        under *name*, or None if there are none.
+        """
+        samples = self.samples.get(name)
+        if not samples:
+            return None
+        return percentile(sorted(samples), p)
+
+    def get_summary(self, percentiles=PERCENTILES):
+        """
+        Return a list of (name, [percentile, ...]) tuples, with the given
+        *percentiles* of the timings of each name, in seconds. The names
+        are sorted by their highest percentile, slowest first.
+        """
+        summary = []
+        for name, samples in self.samples.iteritems():
+            samples = sorted(samples)
+            summary.append((name, [percentile(samples, p)
+                                   for p in percentiles]))
+        summary.sort(key=lambda entry: entry[1][-1], reverse=True)
+        return summary
+
+
+def percentile(sorted_values, p):
+    """
+    Return the *p*-th percentile of *sorted_values*, a non-empty list
+    sorted in ascending order, by the nearest-rank method.
+    """
+    index = (len(sorted_values) * p + 99) / 100 - 1
+    return sorted_values[max(0, min(index, len(sorted_values) - 1))]
+
+
+def enable_profiling(window=300):
+    """
+    Start recording timings in the gameloop, keeping the last *window*
+    of each name, and return the ContextProfiler that receives them.
+    """
+    stack = get_context_stack()
+    if stack.profiler is None:
+        stack.profiler = ContextProfiler(window)
+    else:
+        stack.profiler.window = window
+    return stack.profiler
+
+
+def disable_profiling():
+    """
+    Stop recording timings in the gameloop.
+    """
+    get_context_stack().profiler = None
+
+
+def get_profiler():
+    """
+    Return the ContextProfiler receiving the timings of the gameloop, or
+    None if profiling is disabled.
+    """
+    return get_context_stack().profiler
+
+
+class ProfilerOverlay(Context):
+
+    """
+    A ProfilerOverlay is a Context that shows the percentiles of the
+    slowest timings of the global ContextProfiler on the top left corner
+    of the screen.
+
+    Profiling is enabled when it is stacked, if it was not already.
+
+    *lines* is how many names are shown, *interval* how many frames
+    pass between updates of the text and *font_size* the size of the
+    default pygame font it is rendered with.
+    """
+
+    reports_dirty_rects = True
+
+    def __init__(self, lines=8, interval=30, font_size=14, parent=None):
+        Context.__init__(self, parent)
+        self.lines = lines
+        self.update_interval = interval
+        self.font_size = font_size
+        self.font = None
+        self.surfaces = []
+        self.rect = pygame.Rect(0, 0, 0, 0)
+
+    def initialize(self):
+        enable_profiling()
+        self.font = pygame.font.Font(None, self.font_size)
+
+    def update(self):
+        profiler = get_profiler()
+        if profiler is None:
+            self.surfaces = []
+            return
+
+        texts = ['%-24s %s' % ('ms', ' '.join(['p%-5d' % p
+                                               for p in PERCENTILES]))]
+        for name, values in profiler.get_summary()[:self.lines]:
+            texts.append('%-24s %s' % (name[:24],
+                         ' '.join(['%6.2f' % (value * 1000)
+                                   for value in values])))
+        self.surfaces = [self.font.render(text, False, WHITE)
+                         for text in texts]
+
+        # The rect only grows, so that the old text is always covered
+        width = max([surface.get_width() for surface in self.surfaces])
+        height = sum([surface.get_height() for surface in self.surfaces])
+        self.rect.union_ip(pygame.Rect(0, 0, width + 4, height + 4))
+
+    def draw(self):
+        if not self.surfaces:
+            return
+        screen = get_screen()
+        screen.fill(BLACK, self.rect)
+        y = 2
+        for surface in self.surfaces:
+            screen.blit(surface, (2, y))
+            y += surface.get_height()
+        screen.mark_dirty(self.rect)
+
+
+class FrameRecorder(object):
+
+    """
+    A FrameRecorder keeps a record of every cycle of the gameloop.
+
+    :attr:`frames`
+        List of the recorded frames, as tuples with the fields in
+        FRAME_FIELDS: the time the frame started in seconds since the
+        first recorded one, the time in seconds since the previous
+        frame as measured by the gameloop's Clock, the time in seconds
+        spent updating and drawing, the number of Context updates, the
+        number of Contexts drawn and the id of the map being run, or
+        None.
+    """
+
+    def __init__(self):
+        self.frames = []
+        self.start = None
+
+    def record(self, start, tick, busy, updated, drawn, map_id):
+        """
+        Add a frame that started at *start* seconds, as given by
+        timeit.default_timer().
+        """
+        if self.start is None:
+            self.start = start
+        self.frames.append((start - self.start, tick, busy, updated, drawn,
+                            map_id))
+
+    def save(self, filename):
+        """
+        Write the recorded frames to *filename*, as CSV if its extension
+        is .csv or in a compact binary format otherwise.
+
+        Map ids are stored as strings.
+        """
+        if filename.lower().endswith('.csv'):
+            save_frames_csv(filename, self.frames)
+        else:
+            save_frames_binary(filename, self.frames)
+
+
+def save_frames_csv(filename, frames):
+    f = open(filename, 'wb')
+    try:
+        writer = csv.writer(f)
+        writer.writerow(FRAME_FIELDS)
+        for timestamp, tick, busy, updated, drawn, map_id in frames:
+            if map_id is None:
+                map_id = ''
+            writer.writerow(['%.6f' % timestamp, '%.6f' % tick,
+                             '%.6f' % busy, updated, drawn, map_id])
+    finally:
+        f.close()
+
+
+def save_frames_binary(filename, frames):
+    map_ids = []
+    map_indices = {}
+    records = []
+    for timestamp, tick, busy, updated, drawn, map_id in frames:
+        if map_id is None:
+            index = NO_MAP
+        else:
+            map_id = str(map_id)
+            index = map_indices.get(map_id)
+            if index is None:
+                index = map_indices[map_id] = len(map_ids)
+                map_ids.append(map_id)
+        records.append(FRAME_RECORD.pack(timestamp, tick, busy,
+                                         min(updated, 0xffff),
+                                         min(drawn, 0xffff), index))
+
+    f = open(filename, 'wb')
+    try:
+        f.write(FRAME_LOG_HEADER.pack(FRAME_LOG_MAGIC, FRAME_LOG_VERSION,
+                                      len(map_ids), len(records)))
+        for map_id in map_ids:
+            f.write(struct.pack('<H', len(map_id)))
+            f.write(map_id)
+        f.write(''.join(records))
+    finally:
+        f.close()
+
+
+def load_frames(filename):
+    """
+    Return the frames saved by FrameRecorder.save() to *filename*, as
+    a list of tuples with the fields in FRAME_FIELDS.
+
+    Map ids are returned as strings, or None for frames without a map.
+    Raise ValueError if the file is not a frame log.
+    """
+    f = open(filename, 'rb')
+    try:
+        data = f.read()
+    finally:
+        f.close()
+
+    if not data.startswith(FRAME_LOG_MAGIC):
+        return load_frames_csv(data)
+
+    if len(data) < FRAME_LOG_HEADER.size:
+        raise ValueError('%s is truncated' % filename)
+    magic, version, map_count, count = FRAME_LOG_HEADER.unpack(
+                                           data[:FRAME_LOG_HEADER.size])
+    if version != FRAME_LOG_VERSION:
+        raise ValueError('%s has unknown version %d' % (filename, version))
+
+    try:
+        offset = FRAME_LOG_HEADER.size
+        map_ids = []
+        for i in xrange(map_count):
+            length, = struct.unpack('<H', data[offset:offset + 2])
+            offset += 2
+            map_ids.append(data[offset:offset + length])
+            offset += length
+
+        frames = []
+        for i in xrange(count):
+            (timestamp, tick, busy, updated, drawn,
+             index) = FRAME_RECORD.unpack_from(data, offset)
+            offset += FRAME_RECORD.size
+            if index == NO_MAP:
+                map_id = None
+            else:
+                map_id = map_ids[index]
+            frames.append((timestamp, tick, busy, updated, drawn, map_id))
+    except (struct.error, IndexError):
+        raise ValueError('%s is truncated' % filename)
+    return frames
+
+
+def load_frames_csv(data):
+    lines = data.splitlines()
+    if not lines or tuple(lines[0].split(',')) != FRAME_FIELDS:
+        raise ValueError('Not a frame log')
+
+    frames = []
+    for row in csv.reader(lines[1:]):
+        timestamp, tick, busy, updated, drawn, map_id = row
+        frames.append((float(timestamp), float(tick), float(busy),
+                       int(updated), int(drawn), map_id or None))
+    return frames
+
+
+def get_histogram(frames, field='tick', bucket=0.001):
+    """
+    Return a histogram of the *field* of *frames*, which should be
+    'tick' or 'busy', as a sorted list of (bucket_start, count) tuples.
+    Each bucket is *bucket* seconds wide and empty buckets are left out.
+    """
+    index = FRAME_FIELDS.index(field)
+    counts = {}
+    for frame in frames:
+        key = int(frame[index] / bucket)
+        counts[key] = counts.get(key, 0) + 1
+    return [(key * bucket, counts[key]) for key in sorted(counts)]
+
+
+def enable_recording():
+    """
+    Start recording the frames of the gameloop and return the
+    FrameRecorder that receives them.
+    """
+    stack = get_context_stack()
+    if stack.recorder is None:
+        stack.recorder = FrameRecorder()
+    return stack.recorder
+
+
+def disable_recording():
+    """
+    Stop recording the frames of the gameloop and return the
+    FrameRecorder that received them, or None if they were not being
+    recorded.
+    """
+    stack = get_context_stack()
+    recorder = stack.recorder
+    stack.recorder = None
+    return recorder
+
+
+def get_recorder():
+    """
+    Return the FrameRecorder receiving the frames of the gameloop, or
+    None if they are not being recorded.
+    """
+    return get_context_stack().recorder
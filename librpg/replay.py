@@ -0,0 +1,184 @@
+"""
+The :mod:`replay` module records the input received by the gameloop and
+feeds it back later, so that a play session can be repeated exactly,
+for instance to benchmark it or to find which change made it slower.
+
+An input source is an object with a get_input() method returning the
+mouse buttons, the mouse position and the list of pygame events for the
+current cycle. The ContextStack reads the input from the one set with
+set_input_source(), or straight from pygame if there is none.
+
+Replays are deterministic as long as the game only depends on the input
+and on the gameloop's frame count, so games using the random module
+should seed it, and saved games loaded at startup should be the same.
+"""
+
+import sys
+import pickle
+
+import pygame
+
+from librpg.context import get_context_stack
+from librpg.animation import get_metronome
+
+VERSION = 1
+
+
+class InputRecorder(object):
+
+    """
+    An InputRecorder is an input source that reads the input from
+    pygame and records it, tagged with the frame it was read in.
+
+    :attr:`frames`
+        How many frames were recorded.
+
+    :attr:`records`
+        List of (frame, buttons, pos, events) tuples for the frames in
+        which there were events or the mouse changed, *frame* being
+        counted from the first recorded one and *events* a list of
+        (type, dict) tuples.
+    """
+
+    def __init__(self):
+        self.frames = 0
+        self.records = []
+        self.first_frame = None
+        self.last_mouse = None
+
+    def get_input(self):
+        buttons = pygame.mouse.get_pressed()
+        pos = pygame.mouse.get_pos()
+        events = pygame.event.get()
+
+        frame = get_metronome().get()
+        if self.first_frame is None:
+            self.first_frame = frame
+        frame -= self.first_frame
+        self.frames = frame + 1
+
+        if events or (buttons, pos) != self.last_mouse:
+            self.records.append((frame, buttons, pos,
+                                 [(event.type, event.dict)
+                                  for event in events]))
+            self.last_mouse = (buttons, pos)
+        return buttons, pos, events
+
+    def save(self, filename):
+        """
+        Write the recorded input to *filename*.
+        """
+        f = open(filename, 'wb')
+        try:
+            pickle.dump({'version': VERSION,
+                         'frames': self.frames,
+                         'records': self.records}, f, 2)
+        finally:
+            f.close()
+
+
+class InputReplay(object):
+
+    """
+    An InputReplay is an input source that feeds back the input saved
+    by an InputRecorder to *filename*, starting from the first frame it
+    is read in.
+
+    Once all recorded frames were fed, the ContextStack is stopped
+    every cycle, so that the game ends.
+    """
+
+    def __init__(self, filename):
+        f = open(filename, 'rb')
+        try:
+            data = pickle.load(f)
+        finally:
+            f.close()
+        if not isinstance(data, dict) or data.get('version') != VERSION:
+            raise ValueError('%s is not an input recording' % filename)
+        self.init_records(data['frames'], data['records'])
+
+    def init_records(self, frames, records, mouse_pos=(0, 0)):
+        self.frames = frames
+        self.records = records
+        self.next_record = 0
+        self.first_frame = None
+        self.mouse = ((0, 0, 0), mouse_pos)
+
+    def get_input(self):
+        # Keep the window responsive, ignoring what it receives
+        pygame.event.pump()
+
+        frame = get_metronome().get()
+        if self.first_frame is None:
+            self.first_frame = frame
+        frame -= self.first_frame
+
+        if frame >= self.frames:
+            get_context_stack().stop()
+            return self.mouse[0], self.mouse[1], []
+
+        events = []
+        while (self.next_record < len(self.records)
+               and self.records[self.next_record][0] <= frame):
+            record_frame, buttons, pos, record_events = \
+                self.records[self.next_record]
+            self.mouse = (buttons, pos)
+            events.extend([pygame.event.Event(type, dict)
+                           for type, dict in record_events])
+            self.next_record += 1
+        return self.mouse[0], self.mouse[1], events
+
+    def is_finished(self):
+        """
+        Return whether all the recorded events were fed.
+        """
+        return self.next_record >= len(self.records)
+
+
+class ScriptedInput(InputReplay):
+
+    """
+    A ScriptedInput is an input source that feeds predefined events,
+    such as the key presses of a test, instead of recorded ones.
+
+    *events* should be a list of (frame, event) tuples, *frame* being
+    counted from the first frame the input is read in and *event* a
+    pygame event or a (type, dict) tuple. The mouse stays still at
+    *mouse_pos*.
+
+    If *frames* is given, the ContextStack is stopped after that many
+    frames, the same way an InputReplay stops when the recording ends.
+    """
+
+    def __init__(self, events, frames=None, mouse_pos=(0, 0)):
+        records = []
+        for frame, event in sorted(events, key=lambda entry: entry[0]):
+            if isinstance(event, tuple):
+                type, dict = event
+            else:
+                type, dict = event.type, event.dict
+            if records and records[-1][0] == frame:
+                records[-1][3].append((type, dict))
+            else:
+                records.append((frame, (0, 0, 0), mouse_pos,
+                                [(type, dict)]))
+        if frames is None:
+            frames = sys.maxint
+        self.init_records(frames, records, mouse_pos)
+
+
+def set_input_source(source):
+    """
+    Make the gameloop read its input from *source*, or from pygame if
+    *source* is None.
+    """
+    get_context_stack().input_source = source
+
+
+def get_input_source():
+    """
+    Return the input source the gameloop reads from, or None if it
+    reads from pygame.
+    """
+    return get_context_stack().input_source
@@ -1,7 +1,9 @@
 import csv
+from array import array
+
 import pygame
 
-from librpg.image import TileImage, SlicedImage
+from librpg.image import TileImage, SlicedImage, convert_surface
 from librpg.config import graphics_config
 from librpg.locals import ANIMATION_PERIOD
 
@@ -21,12 +23,16 @@ class Tile(object):
     open_directions: [bool] (read-only)
     4-position array with boolean values indicating if the tile is
     enterable by the given side.
+
+    id: int (read-only)
+    Index of the tile in its Tileset.
     """
 
     BELOW, OBSTACLE, COUNTER, ABOVE = 0, 1, 2, 3
 
-    def __init__(self, image):
+    def __init__(self, image, id=-1):
         self.image = image
+        self.id = id
         self.obstacle = -1
         self.open_directions = [None] * 4
 
@@ -66,9 +72,21 @@ class Tileset(object):
 
     boundaries_file: string (read-only)
     Name of the .bnd file containing the attributes of each tile.
+
+    obstacles: array('b') (read-only)
+    Obstacle type of each tile, indexed by tile id, as in Tile.obstacle.
+
+    closed_directions: array('B') (read-only)
+    Sides by which each tile cannot be entered, indexed by tile id, as a
+    bitmask with bit (direction - 1) set for each closed side.
+
+    on_change: callable
+    If not None, called with no arguments whenever the attribute tables
+    are built again.
     """
 
     def __init__(self, image_file, boundaries_file):
+        self.on_change = None
         self.image_file = image_file
         self.load_image_file()
 
@@ -93,8 +111,8 @@ class Tileset(object):
         self.tiles = []
         sliced_image = SlicedImage(self.image, tsize, tsize)
         for i in xrange(self.size):
-            ssur = sliced_image.get_slice(i)
-            self.tiles.append(Tile(TileImage([ssur])))
+            ssur = convert_surface(sliced_image.get_slice(i))
+            self.tiles.append(Tile(TileImage([ssur]), i))
 
     def load_boundaries_file(self):
         f = file(self.boundaries_file, "r")
@@ -110,6 +128,23 @@ class Tileset(object):
                 elif normalize_type == 'animated':
                     self.process_animated_bnd_line(line)
         f.close()
+        self.build_attribute_tables()
+
+    def build_attribute_tables(self):
+        """
+        Fill obstacles and closed_directions from the attributes of the
+        tiles. Should be called again if those attributes are changed.
+        """
+        self.obstacles = array('b', [tile.obstacle for tile in self.tiles])
+        self.closed_directions = array('B', [0] * self.size)
+        for id, tile in enumerate(self.tiles):
+            mask = 0
+            for i, closed in enumerate(tile.open_directions):
+                if closed:
+                    mask |= 1 << i
+            self.closed_directions[id] = mask
+        if self.on_change is not None:
+            self.on_change()
 
     def process_normal_bnd_line(self, y, line):
         assert y == int(line[1]),\
@@ -126,3 +161,130 @@ class Tileset(object):
         new_image = TileImage([self.tiles[i].get_surface() for i in ids])
         for id in ids:
             self.tiles[id].image = new_image
+
+
+class TileLayer(object):
+
+    """
+    A map layer made of tiles from a single Tileset. Instead of
+    references to Tile objects, it stores the id of each tile in an
+    array of unsigned shorts, so that it takes 2 bytes per cell. Indexing
+    it with (x, y) returns the Tile, as with a Matrix.
+
+    tileset: Tileset (read-only)
+    Tileset the ids refer to.
+
+    width: int (read-only)
+    Layer width.
+
+    height: int (read-only)
+    Layer height.
+
+    ids: array('H') (read-only)
+    Tile id of each cell, in row-major order, so that the cell (x, y) is
+    at index y * width + x. Meant for bulk queries, together with the
+    attribute tables of the Tileset.
+
+    on_change: callable
+    If not None, called with (start, stop) whenever the cells from index
+    start up to, but not including, stop are set through the TileLayer.
+    """
+
+    def __init__(self, tileset, width, height):
+        self.tileset = tileset
+        self.width = width
+        self.height = height
+        self.ids = array('H', [0]) * (width * height)
+        self.on_change = None
+
+    def __repr__(self):
+        return '(TileLayer %s x %s)' % (self.width, self.height)
+
+    def __getitem__(self, pos):
+        """
+        Return the Tile at *pos* == (x, y).
+
+        Raises IndexError if x or y are not inside the layer's limits.
+        """
+        return self.tileset.tiles[self.ids[self.get_index(pos)]]
+
+    def __setitem__(self, pos, tile):
+        """
+        Set the tile at *pos* == (x, y) to *tile*, a Tile of the layer's
+        Tileset or its id.
+
+        Raises IndexError if x or y are not inside the layer's limits.
+        """
+        if isinstance(tile, Tile):
+            tile = tile.id
+        self.check_id(tile)
+        index = self.get_index(pos)
+        self.ids[index] = tile
+        if self.on_change is not None:
+            self.on_change(index, index + 1)
+
+    def valid(self, pos):
+        """
+        Return whether *pos* == (x, y) is inside the layer's limits.
+        """
+        x, y = pos
+        return x < self.width and x >= 0 and y < self.height and y >= 0
+
+    def get_index(self, pos):
+        """
+        Return the index of *pos* == (x, y) in ids.
+
+        Raises IndexError if x or y are not inside the layer's limits.
+        """
+        x, y = pos
+        if not self.valid(pos):
+            raise IndexError('%s was indexed with x=%s y=%s'
+                             % (repr(self), x, y))
+        return y * self.width + x
+
+    def get_id(self, pos):
+        """
+        Return the id of the tile at *pos* == (x, y).
+        """
+        return self.ids[self.get_index(pos)]
+
+    def get_obstacle(self, pos):
+        """
+        Return the obstacle type of the tile at *pos* == (x, y).
+        """
+        return self.tileset.obstacles[self.ids[self.get_index(pos)]]
+
+    def set_row(self, y, ids):
+        """
+        Set the tiles of the line *y* to *ids*, a sequence of tile ids.
+        """
+        ids = array('H', ids)
+        if len(ids) != self.width:
+            raise ValueError('Line %d of %s should have %d tiles'
+                             % (y, repr(self), self.width))
+        if ids:
+            self.check_id(max(ids))
+        start = y * self.width
+        self.ids[start:start + self.width] = ids
+        if self.on_change is not None:
+            self.on_change(start, start + self.width)
+
+    def set_ids(self, ids):
+        """
+        Set the tiles of the whole layer to *ids*, a sequence of tile ids
+        in row-major order.
+        """
+        if not isinstance(ids, array) or ids.typecode != 'H':
+            ids = array('H', ids)
+        if len(ids) != len(self.ids):
+            raise ValueError('%s should have %d tiles'
+                             % (repr(self), len(self.ids)))
+        if ids:
+            self.check_id(max(ids))
+        self.ids[:] = ids
+        if self.on_change is not None:
+            self.on_change(0, len(ids))
+
+    def check_id(self, id):
+        if id < 0 or id >= self.tileset.size:
+            raise IndexError('%s has no tile %s' % (repr(self), id))
@@ -0,0 +1,124 @@
+"""
+Batch simulation runner.
+
+Runs many headless simulations of a World across all cores, each with
+its own random seed, and reports how each of them went:
+
+    python batch_run.py -n 64 --seconds 3600 mygame.worlds:make_world
+
+MODULE:FUNCTION names a function that returns a World ready for
+gameloop(), see librpg.batch.BatchJob. An optional MODULE:FUNCTION
+given with --check is called with the World after each simulation, and
+the run fails if it raises an exception.
+
+Exits with status 1 if any run failed. Run with --help for the options.
+"""
+
+import os
+import sys
+from optparse import OptionParser
+from timeit import default_timer
+
+
+def parse_parameters():
+    parser = OptionParser(usage='python batch_run.py [options] '
+                                'MODULE:FUNCTION [ARGS...]')
+    parser.disable_interspersed_args()
+    parser.add_option('-n', '--runs', type='int', default=None,
+                      help='number of runs [one per process]')
+    parser.add_option('-j', '--processes', type='int', default=None,
+                      help='worker processes [one per core]')
+    parser.add_option('-t', '--ticks', type='int', default=None,
+                      help='ticks to simulate in each run')
+    parser.add_option('-s', '--seconds', type='float', default=None,
+                      help='seconds of game time to simulate in each run')
+    parser.add_option('--fps', type='int', default=30,
+                      help='ticks per second of game time [%default]')
+    parser.add_option('--input', default=None, metavar='FILE',
+                      help='feed the input recorded to FILE to every run')
+    parser.add_option('--check', default=None, metavar='MODULE:FUNCTION',
+                      help='function to call with each World at the end')
+    parser.add_option('--seed', type='int', default=0,
+                      help='seed of the first run, the others use the '
+                           'following ones [%default]')
+    parser.add_option('--reuse-processes', action='store_true',
+                      default=False,
+                      help='run several jobs in each process instead of '
+                           'starting a new one for each')
+    parser.add_option('-v', '--verbose', action='store_true', default=False,
+                      help='print the traceback of failed runs')
+    options, args = parser.parse_args()
+    if not args:
+        parser.error('expected a world factory')
+    if options.ticks is not None and options.seconds is not None:
+        parser.error('--ticks and --seconds are exclusive')
+    return options, args[0], args[1:]
+
+
+def import_function(spec):
+    module_name, function_name = spec.split(':')
+    module = __import__(module_name, {}, {}, [function_name])
+    return getattr(module, function_name)
+
+
+def main():
+    options, factory_spec, args = parse_parameters()
+    sys.path.insert(0, os.getcwd())
+
+    from librpg.batch import BatchJob, run_batch
+
+    factory = import_function(factory_spec)
+    check = None
+    if options.check is not None:
+        check = import_function(options.check)
+    input_file = None
+    if options.input is not None:
+        input_file = os.path.abspath(options.input)
+
+    ticks = options.ticks
+    if options.seconds is not None:
+        ticks = int(options.seconds * options.fps)
+
+    runs = options.runs
+    if runs is None:
+        import multiprocessing
+        runs = options.processes or multiprocessing.cpu_count()
+
+    jobs = []
+    for i in xrange(runs):
+        seed = options.seed + i
+        jobs.append(BatchJob(factory, tuple(args), ticks=ticks,
+                             input_file=input_file, check=check, seed=seed,
+                             name='seed %d' % seed))
+
+    def report(result):
+        if result.ok:
+            status = 'ok'
+        else:
+            status = 'FAILED'
+        line = '%-12s %-6s %9d ticks %8.2f s %9.0f ticks/s  pid %d' % (
+               result.name, status, result.ticks, result.elapsed,
+               result.get_rate(), result.pid)
+        if result.check_result is not None:
+            line += '  check %r' % (result.check_result,)
+        print line
+        if not result.ok and options.verbose:
+            print result.error
+        sys.stdout.flush()
+
+    start = default_timer()
+    results = run_batch(jobs, options.processes,
+                        not options.reuse_processes, report)
+    elapsed = default_timer() - start
+
+    failed = [result for result in results if not result.ok]
+    ticks_run = sum([result.ticks for result in results])
+    print '%d runs, %d failed, %d ticks in %.2f s, %.0f ticks/s overall' % (
+          len(results), len(failed), ticks_run, elapsed,
+          ticks_run / max(elapsed, 1e-6))
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""
+Frame log viewer.
+
+Prints a summary and a histogram of the frame times in a log written by
+librpg.profiling.FrameRecorder.save(). Given two logs, for instance from
+two builds running the same recorded input, it also compares them frame
+by frame.
+
+Run with --help for the options.
+"""
+
+import sys
+from optparse import OptionParser
+
+from librpg.profiling import (load_frames, get_histogram, percentile,
+                              PERCENTILES, FRAME_FIELDS)
+
+BAR_WIDTH = 50
+
+
+def parse_parameters():
+    parser = OptionParser(usage='python frame_log.py [options] LOG [LOG]')
+    parser.add_option('-f', '--field', default='tick',
+                      choices=['tick', 'busy'],
+                      help='frame time to show, "tick" for the time '
+                           'between frames or "busy" for the time spent '
+                           'updating and drawing [%default]')
+    parser.add_option('-b', '--bucket', type='float', default=1.0,
+                      metavar='MS', help='histogram bucket width in '
+                                         'milliseconds [%default]')
+    parser.add_option('--per-map', action='store_true', default=False,
+                      help='also summarize each map separately')
+    options, args = parser.parse_args()
+    if len(args) not in (1, 2):
+        parser.error('expected one or two frame logs')
+    return options, args
+
+
+def summarize(name, frames, field):
+    index = FRAME_FIELDS.index(field)
+    times = sorted([frame[index] for frame in frames])
+    columns = ['%-20s' % name, '%6d frames' % len(frames)]
+    if frames:
+        duration = frames[-1][0] - frames[0][0]
+        if duration > 0:
+            columns.append('%6.1f fps' % ((len(frames) - 1) / duration))
+        for p in PERCENTILES:
+            columns.append('p%d %7.2f ms' % (p, percentile(times, p) * 1000))
+        columns.append('max %7.2f ms' % (times[-1] * 1000))
+    print '  '.join(columns)
+
+
+def print_histogram(frames, field, bucket):
+    histogram = get_histogram(frames, field, bucket / 1000.0)
+    if not histogram:
+        return
+    highest = max([count for start, count in histogram])
+    for start, count in histogram:
+        bar = '#' * max(1, count * BAR_WIDTH / highest)
+        print '%8.1f ms %7d %s' % (start * 1000, count, bar)
+
+
+def compare(frames, other_frames, field):
+    index = FRAME_FIELDS.index(field)
+    count = min(len(frames), len(other_frames))
+    if len(frames) != len(other_frames):
+        print 'Logs have %d and %d frames, comparing the first %d' % (
+              len(frames), len(other_frames), count)
+    if not count:
+        return
+    deltas = sorted([other_frames[i][index] - frames[i][index]
+                     for i in xrange(count)])
+    columns = ['%-20s' % 'second - first']
+    for p in PERCENTILES:
+        columns.append('p%d %+7.2f ms' % (p, percentile(deltas, p) * 1000))
+    print '  '.join(columns)
+
+    mismatches = [i for i in xrange(count)
+                  if frames[i][3:] != other_frames[i][3:]]
+    if mismatches:
+        print ('%d frames differ in the contexts run or the map, the first '
+               'is frame %d' % (len(mismatches), mismatches[0]))
+
+
+def main():
+    options, filenames = parse_parameters()
+    logs = []
+    for filename in filenames:
+        try:
+            logs.append(load_frames(filename))
+        except (EnvironmentError, ValueError), e:
+            print >>sys.stderr, 'Could not load %s: %s' % (filename, e)
+            sys.exit(1)
+
+    for filename, frames in zip(filenames, logs):
+        print filename
+        summarize('all maps', frames, options.field)
+        if options.per_map:
+            map_ids = []
+            for frame in frames:
+                if frame[5] not in map_ids:
+                    map_ids.append(frame[5])
+            for map_id in map_ids:
+                summarize('map %s' % map_id,
+                          [frame for frame in frames if frame[5] == map_id],
+                          options.field)
+        print_histogram(frames, options.field, options.bucket)
+        print
+
+    if len(logs) == 2:
+        compare(logs[0], logs[1], options.field)
+
+
+if __name__ == '__main__':
+    main()
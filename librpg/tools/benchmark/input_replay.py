@@ -0,0 +1,99 @@
+"""
+Input recording and replay driver.
+
+Runs a LibRPG game script while recording its input, or runs it again
+feeding it the recorded input, by default without opening a window:
+
+    python input_replay.py record walk.input ../../test/worldtest.py
+    python input_replay.py replay walk.input ../../test/worldtest.py
+
+A replay reports how long it took and can save the frame timings with
+--frame-log, to be compared with frame_log.py.
+
+Run with --help for the options.
+"""
+
+import os
+import sys
+import random
+from optparse import OptionParser
+from timeit import default_timer
+
+
+def parse_parameters():
+    parser = OptionParser(usage='python input_replay.py [options] '
+                                'record|replay INPUT SCRIPT [ARGS...]')
+    parser.disable_interspersed_args()
+    parser.add_option('--window', action='store_true', default=False,
+                      help='show the game window while replaying')
+    parser.add_option('--seed', type='int', default=0,
+                      help='seed for the random module, which should be '
+                           'the same when recording and replaying '
+                           '[%default]')
+    parser.add_option('--frame-log', default=None, metavar='FILE',
+                      help='save the frame timings of the replay to FILE')
+    options, args = parser.parse_args()
+    if len(args) < 3 or args[0] not in ('record', 'replay'):
+        parser.error('expected record or replay, an input file and a '
+                     'script')
+    return options, args[0], args[1], args[2], args[3:]
+
+
+def run_script(script, args):
+    script = os.path.abspath(script)
+    directory = os.path.dirname(script)
+    sys.argv = [script] + args
+    sys.path.insert(0, directory)
+    os.chdir(directory)
+    try:
+        execfile(script, {'__name__': '__main__', '__file__': script})
+    except SystemExit:
+        pass
+
+
+def main():
+    options, mode, input_file, script, args = parse_parameters()
+    input_file = os.path.abspath(input_file)
+    if options.frame_log is not None:
+        options.frame_log = os.path.abspath(options.frame_log)
+    if mode == 'replay' and not options.window:
+        os.environ['SDL_VIDEODRIVER'] = 'dummy'
+
+    from librpg.config import graphics_config
+    from librpg.animation import get_metronome
+    from librpg.replay import InputRecorder, InputReplay, set_input_source
+    from librpg.profiling import enable_recording
+
+    random.seed(options.seed)
+    if mode == 'record':
+        source = InputRecorder()
+    else:
+        source = InputReplay(input_file)
+        if not options.window:
+            # The dummy display would pick a format unlike the Surfaces'
+            graphics_config.display_depth = 32
+    set_input_source(source)
+    if options.frame_log is not None:
+        recorder = enable_recording()
+
+    start = default_timer()
+    first_frame = get_metronome().get()
+    try:
+        run_script(script, args)
+    finally:
+        elapsed = default_timer() - start
+        frames = get_metronome().get() - first_frame
+        if mode == 'record':
+            source.save(input_file)
+            print 'Recorded %d frames to %s' % (source.frames, input_file)
+        else:
+            if not source.is_finished():
+                print 'The game ended before the recorded input did'
+            print '%d frames in %.2f s, %.1f frames/s' % (
+                  frames, elapsed, frames / max(elapsed, 1e-6))
+        if options.frame_log is not None:
+            recorder.save(options.frame_log)
+
+
+if __name__ == '__main__':
+    main()
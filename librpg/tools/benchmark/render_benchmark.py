@@ -0,0 +1,326 @@
+"""
+Headless rendering benchmark.
+
+Loads the test maps, synthetic maps and a menu without opening a window,
+runs a number of frames of each and reports the load time, frame time
+percentiles and peak surface memory of the rendered map layers.
+
+With --cache-dir, each map is also loaded from a warm layer cache, to
+compare the load time with composing its layers.
+
+Run with --help for the options. The test maps are only found if the
+test directory was installed along with librpg.
+"""
+
+import os
+import sys
+import random
+import tempfile
+from optparse import OptionParser
+from timeit import default_timer
+
+if 'SDL_VIDEODRIVER' not in os.environ:
+    os.environ['SDL_VIDEODRIVER'] = 'dummy'
+
+import librpg
+from librpg.config import graphics_config
+from librpg.context import get_context_stack
+from librpg.profiling import percentile
+from librpg.virtualscreen import get_screen
+from librpg.animation import get_metronome
+from librpg.mapobject import MapObject
+from librpg.movement import Step, Wait
+from librpg.util import Position
+from librpg.locals import UP, RIGHT, DOWN, LEFT
+from librpg.menu import Menu, Grid, Panel, Label, Bar, AlignCenter, Cursor
+
+TEST_DIR = os.path.join(os.path.dirname(librpg.__file__), 'test')
+DIRECTIONS = [UP, RIGHT, DOWN, LEFT]
+PERCENTILES = [50, 90, 99]
+
+
+def parse_parameters():
+    parser = OptionParser(usage='python render_benchmark.py [options]')
+    parser.add_option('-n', '--frames', type='int', default=300,
+                      help='frames to run for each case [%default]')
+    parser.add_option('-m', '--map-size', action='append', default=[],
+                      metavar='WxH',
+                      help='add a synthetic map of WxH tiles, may be '
+                           'repeated [64x64 and 256x256]')
+    parser.add_option('-o', '--objects', type='int', default=100,
+                      help='wandering objects in synthetic maps [%default]')
+    parser.add_option('--screen', default='400x300', metavar='WxH',
+                      help='virtual screen size [%default]')
+    parser.add_option('--scale', type='float', default=2,
+                      help='graphics_config.scale [%default]')
+    parser.add_option('--prescale', action='store_true', default=False,
+                      help='enable graphics_config.prescale')
+    parser.add_option('--dirty-rects', action='store_true', default=False,
+                      help='enable graphics_config.dirty_rects')
+    parser.add_option('--chunk-size', type='int', default=None,
+                      help='graphics_config.background_chunk_size')
+    parser.add_option('--threaded', action='store_true', default=False,
+                      help='enable graphics_config.threaded_map_loading')
+    parser.add_option('--cache-dir', default=None, metavar='DIR',
+                      help='also run each map loaded from a layer cache '
+                           'in DIR, filled beforehand')
+    parser.add_option('--seed', type='int', default=0,
+                      help='random seed [%default]')
+    parser.add_option('--max-p99', type='float', default=None, metavar='MS',
+                      help='exit with status 1 if any case has a 99th '
+                           'percentile frame time above MS milliseconds')
+    options, args = parser.parse_args()
+    if not options.map_size:
+        options.map_size = ['64x64', '256x256']
+    return options
+
+
+def parse_size(size):
+    width, height = size.lower().split('x')
+    return int(width), int(height)
+
+
+def configure(options, dimensions, cache_dir=None):
+    tile_size, object_width, object_height = dimensions
+    screen_width, screen_height = parse_size(options.screen)
+    graphics_config.config(tile_size=tile_size,
+                           object_width=object_width,
+                           object_height=object_height,
+                           screen_width=screen_width,
+                           screen_height=screen_height,
+                           scale=options.scale,
+                           prescale=options.prescale,
+                           dirty_rects=options.dirty_rects,
+                           background_chunk_size=options.chunk_size,
+                           threaded_map_loading=options.threaded,
+                           map_cache_dir=cache_dir)
+
+
+def write_synthetic_map(width, height, terrain_tiles, scenario_tiles):
+    lines = ['%d, %d, 1' % (width, height), '']
+    for y in xrange(height):
+        lines.append(','.join([str(random.randrange(terrain_tiles))
+                               for x in xrange(width)]))
+    lines.append('')
+    for y in xrange(height):
+        row = []
+        for x in xrange(width):
+            if random.random() < 0.2:
+                row.append(str(random.randrange(1, scenario_tiles)))
+            else:
+                row.append('0')
+        lines.append(','.join(row))
+    lines.append('')
+
+    fd, filename = tempfile.mkstemp(suffix='.map')
+    f = os.fdopen(fd, 'w')
+    f.write('\n'.join(lines))
+    f.close()
+    return filename
+
+
+class WanderingObject(MapObject):
+
+    def __init__(self, image_file):
+        MapObject.__init__(self, MapObject.OBSTACLE, image_file=image_file)
+        for i in xrange(8):
+            movements = self.movement_behavior.movements
+            movements.append(Step(random.choice(DIRECTIONS)))
+            movements.append(Wait(random.randint(0, 10)))
+
+
+class SyntheticMap(librpg.map.MapModel):
+
+    def __init__(self, map_file, objects, image_file):
+        librpg.map.MapModel.__init__(self, map_file,
+            (librpg.path.tileset_path('city_lower.png'),
+             librpg.path.tileset_path('city_lower.bnd')),
+            [(librpg.path.tileset_path('city_upper.png'),
+              librpg.path.tileset_path('city_upper.bnd'))])
+        self.object_count = objects
+        self.image_file = image_file
+
+    def initialize(self, local_state, global_state):
+        used = set([self.party_avatar.position])
+        for i in xrange(min(self.object_count,
+                            self.width * self.height - 1)):
+            position = self.party_avatar.position
+            while position in used:
+                position = Position(random.randrange(self.width),
+                                    random.randrange(self.height))
+            used.add(position)
+            self.add_object(WanderingObject(self.image_file), position)
+
+
+class PulsingBar(Bar):
+
+    def update(self):
+        self.filled = (get_metronome().get() % 50) / 49.0
+
+
+class BenchmarkMenu(Menu):
+
+    def __init__(self, width, height):
+        Menu.__init__(self, width, height)
+        grid = Grid(width, height, 4, 10)
+        for i in xrange(4):
+            for j in xrange(10):
+                grid[i, j].add_widget(Panel(width / 4, height / 10),
+                                      AlignCenter())
+                if j % 2:
+                    widget = PulsingBar(width / 4 - 10, height / 20)
+                else:
+                    widget = Label('Item %d' % (i * 10 + j))
+                grid[i, j].add_widget(widget, AlignCenter())
+        self.add_widget(grid, AlignCenter())
+        Cursor().bind(self)
+
+
+def run_frames(controller, frames, memory=None):
+    screen = get_screen()
+    metronome = get_metronome()
+    times = []
+    peak = 0
+    for i in xrange(frames):
+        start = default_timer()
+        metronome.step()
+        controller.update()
+        controller.draw()
+        screen.flip()
+        times.append(default_timer() - start)
+        if memory is not None:
+            peak = max(peak, memory())
+    return times, peak
+
+
+def benchmark_map(map_factory, charset, position, frames):
+    def char_factory(name):
+        return librpg.party.Character(name, charset, 0)
+
+    start = default_timer()
+    map_model = map_factory()
+    world = librpg.world.MicroWorld(map_model, char_factory)
+    world.initial_state(position, ['Hero'])
+    map_model.add_party(world.party, position)
+    map_model.set_states(world.state.load_local(world.TEH_MAP_ID),
+                         world.state)
+    stack = get_context_stack()
+    stack.stack_model(map_model)
+    load_time = default_timer() - start
+
+    avatar = map_model.party_avatar
+
+    def walk_and_measure():
+        if not avatar.scheduled_movement:
+            avatar.schedule_movement(Step(random.choice(DIRECTIONS)))
+        return map_view.get_surface_memory()
+
+    map_view = map_model.controller.map_view
+    times, peak = run_frames(map_model.controller, frames, walk_and_measure)
+
+    for context in list(stack.stack):
+        stack.remove_context(context)
+    map_model.remove_party()
+    return load_time, times, peak
+
+
+def benchmark_menu(frames):
+    start = default_timer()
+    menu = BenchmarkMenu(graphics_config.screen_width,
+                         graphics_config.screen_height)
+    stack = get_context_stack()
+    stack.stack_model(menu)
+    load_time = default_timer() - start
+
+    times, peak = run_frames(menu.controller, frames)
+
+    for context in list(stack.stack):
+        stack.remove_context(context)
+    return load_time, times, None
+
+
+def report(name, load_time, times, peak):
+    times = sorted(times)
+    columns = ['%-16s' % name, 'load %8.1f ms' % (load_time * 1000)]
+    for p in PERCENTILES:
+        columns.append('p%d %6.2f ms' % (p, percentile(times, p) * 1000))
+    if peak is not None:
+        columns.append('peak %7.2f MB' % (peak / (1024.0 * 1024.0)))
+    print '  '.join(columns)
+    sys.stdout.flush()
+    return percentile(times, 99) * 1000
+
+
+def main():
+    options = parse_parameters()
+    random.seed(options.seed)
+    graphics_config.display_depth = 32
+    librpg.init('LibRPG Benchmark')
+
+    cases = []
+    if os.path.isdir(TEST_DIR):
+        maptest = os.path.join(TEST_DIR, 'maptest.map')
+        city = os.path.join(TEST_DIR, 'city.map')
+        test_tileset = lambda name: os.path.join(TEST_DIR, name)
+        cases.append(('maptest.map', (16, 24, 32),
+                      lambda: librpg.map.MapModel(maptest,
+                          (test_tileset('test16_lower_tileset.png'),
+                           test_tileset('test16_lower_tileset.bnd')),
+                          [(test_tileset('test16_upper_tileset.png'),
+                            test_tileset('test16_upper_tileset.bnd'))] * 2),
+                      test_tileset('test16_charset.png'), Position(0, 0)))
+        cases.append(('city.map', (32, 32, 32),
+                      lambda: librpg.map.MapModel(city,
+                          (librpg.path.tileset_path('city_lower.png'),
+                           librpg.path.tileset_path('city_lower.bnd')),
+                          [(librpg.path.tileset_path('city_upper.png'),
+                            librpg.path.tileset_path('city_upper.bnd'))]),
+                      librpg.path.charset_path('naked_man.png'),
+                      Position(10, 10)))
+    else:
+        print 'Test maps not installed, skipping them.'
+
+    charset = librpg.path.charset_path('naked_man.png')
+    map_files = []
+    for size in options.map_size:
+        width, height = parse_size(size)
+        map_file = write_synthetic_map(width, height, 100, 150)
+        map_files.append(map_file)
+        cases.append(('%dx%d' % (width, height), (32, 32, 32),
+                      lambda map_file=map_file:
+                          SyntheticMap(map_file, options.objects, charset),
+                      charset, Position(width / 2, height / 2)))
+
+    worst = 0
+    try:
+        for name, dimensions, map_factory, charset, position in cases:
+            configure(options, dimensions)
+            result = benchmark_map(map_factory, charset, position,
+                                   options.frames)
+            worst = max(worst, report(name, *result))
+
+            if options.cache_dir is not None:
+                # Fill the cache without the loader thread, which would
+                # not save the layers if it were still running at the end
+                configure(options, dimensions, options.cache_dir)
+                graphics_config.threaded_map_loading = False
+                benchmark_map(map_factory, charset, position, 0)
+                configure(options, dimensions, options.cache_dir)
+                result = benchmark_map(map_factory, charset, position,
+                                       options.frames)
+                worst = max(worst, report(name + ' warm', *result))
+
+        configure(options, (16, 24, 32))
+        worst = max(worst, report('menu', *benchmark_menu(options.frames)))
+    finally:
+        for map_file in map_files:
+            os.remove(map_file)
+
+    if options.max_p99 is not None and worst > options.max_p99:
+        print 'p99 frame time %.2f ms is above %.2f ms' % (worst,
+                                                          options.max_p99)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
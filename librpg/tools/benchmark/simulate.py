@@ -0,0 +1,75 @@
+"""
+Headless simulation driver.
+
+Runs a LibRPG game script as a simulation: its maps are updated as fast
+as the CPU allows, without a window, drawing or FPS cap, for a number of
+ticks. Input recorded with input_replay.py may be fed to it.
+
+    python simulate.py --seconds 3600 ../../test/objecttest.py
+
+Reports how many ticks were run and how many per second.
+
+Run with --help for the options.
+"""
+
+import os
+import random
+from optparse import OptionParser
+
+from input_replay import run_script
+
+
+def parse_parameters():
+    parser = OptionParser(usage='python simulate.py [options] '
+                                'SCRIPT [ARGS...]')
+    parser.disable_interspersed_args()
+    parser.add_option('-t', '--ticks', type='int', default=None,
+                      help='ticks to run')
+    parser.add_option('-s', '--seconds', type='float', default=None,
+                      help='seconds of game time to run, at '
+                           'game_config.fps ticks per second')
+    parser.add_option('--input', default=None, metavar='FILE',
+                      help='feed the input recorded to FILE')
+    parser.add_option('--seed', type='int', default=0,
+                      help='seed for the random module [%default]')
+    options, args = parser.parse_args()
+    if not args:
+        parser.error('expected a script')
+    if options.ticks is not None and options.seconds is not None:
+        parser.error('--ticks and --seconds are exclusive')
+    return options, args[0], args[1:]
+
+
+def main():
+    options, script, args = parse_parameters()
+    os.environ['SDL_VIDEODRIVER'] = 'dummy'
+
+    from librpg.config import graphics_config, game_config
+    from librpg.context import get_context_stack
+    from librpg.replay import InputReplay, set_input_source
+
+    random.seed(options.seed)
+    # The dummy display would pick a format unlike the Surfaces'
+    graphics_config.display_depth = 32
+    if options.input is not None:
+        set_input_source(InputReplay(os.path.abspath(options.input)))
+
+    ticks = options.ticks
+    if options.seconds is not None:
+        ticks = int(options.seconds * game_config.fps)
+
+    context_stack = get_context_stack()
+    context_stack.start_simulation(ticks)
+    try:
+        run_script(script, args)
+    finally:
+        simulation = context_stack.stop_simulation()
+        print '%d ticks in %.2f s, %.0f ticks/s' % (simulation.ticks_run,
+                                                   simulation.get_elapsed(),
+                                                   simulation.get_rate())
+        if ticks is not None and simulation.ticks_run < ticks:
+            print 'The game ended before %d ticks' % ticks
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+Map compiler.
+
+Converts a .map text file into a compiled map, which MapModel loads
+without parsing:
+
+    python compile_map.py city.map lower.png lower.bnd upper.png upper.bnd
+
+The tileset files of the terrain layer come first, followed by those of
+each scenario layer. They are stored relative to the compiled map, so
+MapModel may omit them wherever the map and its tilesets are moved, as
+long as they stay together.
+
+Run with --help for the options.
+"""
+
+from optparse import OptionParser
+from timeit import default_timer
+
+from librpg.mapfile import compile_map, load_map_file
+
+
+def parse_parameters():
+    parser = OptionParser(usage='python compile_map.py [options] MAP '
+                                'TERRAIN_IMAGE TERRAIN_BND '
+                                '[SCENARIO_IMAGE SCENARIO_BND]...')
+    parser.add_option('-o', '--output', default=None, metavar='FILE',
+                      help='write the compiled map to FILE [MAP with the '
+                           'extension changed to .cmap]')
+    options, args = parser.parse_args()
+    if len(args) < 3 or len(args) % 2 != 1:
+        parser.error('expected a map file and pairs of tileset image and '
+                     'boundaries files')
+    tileset_files = zip(args[1::2], args[2::2])
+    return options, args[0], tileset_files
+
+
+def main():
+    options, map_file, tileset_files = parse_parameters()
+
+    start = default_timer()
+    text_layout = load_map_file(map_file)
+    text_elapsed = default_timer() - start
+    if text_layout.get_scenario_number() != len(tileset_files) - 1:
+        raise SystemExit('%s has %d scenario layers, but %d scenario '
+                         'tilesets were given'
+                         % (map_file, text_layout.get_scenario_number(),
+                            len(tileset_files) - 1))
+
+    output = compile_map(map_file, tileset_files[0], tileset_files[1:],
+                         options.output)
+
+    start = default_timer()
+    layout = load_map_file(output)
+    elapsed = default_timer() - start
+    assert layout.layers == text_layout.layers, 'Compiled map differs'
+    print 'Compiled %s (%dx%d, %d layers) to %s' % (
+          map_file, layout.width, layout.height, len(layout.layers), output)
+    print 'Loading takes %.1f ms instead of %.1f ms' % (elapsed * 1000,
+                                                        text_elapsed * 1000)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,6 +3,8 @@ The :mod:`util` module has assorted functions and classes for various
 purposes.
 """
 
+from array import array
+
 from librpg.locals import UP, DOWN, LEFT, RIGHT
 from librpg.config import graphics_config, game_config
 
@@ -13,6 +15,10 @@ class Position(object):
     Represents a pair (x, y) of 2D coordinates. It considers that the
     x axis goes from left to right and the y axis goes downwards.
 
+    Positions are immutable, so they may be shared and used as dict
+    keys. The arithmetic operators and the movement methods return new
+    Positions.
+
     :attr:`x`
         Horizontal position.
 
@@ -20,9 +26,17 @@ class Position(object):
         Vertical position.
     """
 
+    __slots__ = ('x', 'y')
+
     def __init__(self, x=0, y=0):
-        self.x = x
-        self.y = y
+        _set_x(self, x)
+        _set_y(self, y)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Position is immutable')
+
+    def __delattr__(self, name):
+        raise AttributeError('Position is immutable')
 
     def __add__(self, pos):
         """
@@ -65,27 +79,43 @@ class Position(object):
         Return a Position that is the position one would get by walking
         *amount* tiles towards *direction*.
         """
-        return [None, self.up, self.right, self.down,
-                self.left][direction](amount)
+        dx, dy = DIRECTION_OFFSETS[direction]
+        return Position(self.x + dx * amount, self.y + dy * amount)
 
     def __repr__(self):
         return '(%s, %s)' % (self.x, self.y)
 
-    def __cmp__(self, another):
+    def __eq__(self, another):
+        try:
+            return self.x == another.x and self.y == another.y
+        except AttributeError:
+            return NotImplemented
+
+    def __ne__(self, another):
+        try:
+            return self.x != another.x or self.y != another.y
+        except AttributeError:
+            return NotImplemented
+
+    def __lt__(self, another):
         """
         Comparing two Positions will give compare their y coordinates,
         then, if they are tied, compare the x coordinates.
         """
-        if self.y < another.y:
-            return -1
-        elif self.y > another.y:
-            return 1
-        elif self.x < another.x:
-            return -1
-        elif self.x > another.x:
-            return 1
-        else:
-            return 0
+        return (self.y < another.y
+                or self.y == another.y and self.x < another.x)
+
+    def __le__(self, another):
+        return (self.y < another.y
+                or self.y == another.y and self.x <= another.x)
+
+    def __gt__(self, another):
+        return (self.y > another.y
+                or self.y == another.y and self.x > another.x)
+
+    def __ge__(self, another):
+        return (self.y > another.y
+                or self.y == another.y and self.x >= another.x)
 
     def __getitem__(self, i):
         if i == 0:
@@ -95,16 +125,29 @@ class Position(object):
         else:
             raise IndexError('Position is only 2 dimensional')
 
-    def __setitem__(self, i, value):
-        if i == 0:
-            self.x = value
-        elif i == 1:
-            self.y = value
-        else:
-            raise IndexError('Position is only 2 dimensional')
+    def __iter__(self):
+        return iter((self.x, self.y))
 
     def __hash__(self):
-        return hash((self.x, self.y))
+        # Positions are never equal to tuples, so their hashes do not
+        # have to match
+        return (self.y << 16) ^ self.x
+
+    def __reduce__(self):
+        return (Position, (self.x, self.y))
+
+    def __setstate__(self, state):
+        # Positions pickled before they had slots carry their __dict__
+        _set_x(self, state['x'])
+        _set_y(self, state['y'])
+
+
+# The attributes of Positions can only be set through their slots
+_set_x = Position.x.__set__
+_set_y = Position.y.__set__
+
+# Offset of a step towards each direction, indexed by direction
+DIRECTION_OFFSETS = [None, (0, -1), (1, 0), (0, 1), (-1, 0)]
 
 
 class Matrix(object):
@@ -112,17 +155,34 @@ class Matrix(object):
     """
     Represents a 2-dimensional matrix with fast random access.
 
+    The elements are stored in a flat sequence in row-major order: a
+    list or, if a *typecode* is given, an array of that type (see the
+    array module), which takes far less memory for numbers. New elements
+    are set to *default*, by default None for a list and 0 for an array.
+
     :attr:`width`
         Matrix width.
 
     :attr:`height`
         Matrix height.
+
+    :attr:`cells`
+        The flat sequence of elements, in which the element at (x, y) is
+        at index y * width + x.
+
+    :attr:`typecode`
+        Type code of the array holding the elements, or None if they are
+        in a list.
     """
 
-    def __init__(self, width, height):
+    def __init__(self, width, height, typecode=None, default=None):
+        self.typecode = typecode
+        if default is None and typecode is not None:
+            default = 0
+        self.default = default
         self.width = 0
         self.height = 0
-        self.m = []
+        self.cells = self.make_cells(0)
         self.resize(width, height)
 
     def __repr__(self):
@@ -136,10 +196,10 @@ class Matrix(object):
         limits.
         """
         x, y = pos
-        if not self.valid(pos):
+        if x < 0 or x >= self.width or y < 0 or y >= self.height:
             raise IndexError('%s was indexed with x=%s y=%s'
                              % (repr(self), x, y))
-        return self.m[y][x]
+        return self.cells[y * self.width + x]
 
     def __setitem__(self, pos, value):
         """
@@ -149,10 +209,26 @@ class Matrix(object):
         limits.
         """
         x, y = pos
-        if not self.valid(pos):
+        if x < 0 or x >= self.width or y < 0 or y >= self.height:
             raise IndexError('%s was indexed with x=%s y=%s'
                              % (repr(self), x, y))
-        self.m[y][x] = value
+        self.cells[y * self.width + x] = value
+
+    def get(self, x, y):
+        """
+        Return the element at (*x*, *y*) without checking the limits,
+        for callers that already did. Coordinates outside them return
+        another element or raise IndexError.
+        """
+        return self.cells[y * self.width + x]
+
+    def set(self, x, y, value):
+        """
+        Set the element at (*x*, *y*) to *value* without checking the
+        limits, for callers that already did. Coordinates outside them
+        set another element or raise IndexError.
+        """
+        self.cells[y * self.width + x] = value
 
     def valid(self, pos):
         """
@@ -161,39 +237,135 @@ class Matrix(object):
         x, y = pos
         return x < self.width and x >= 0 and y < self.height and y >= 0
 
+    def get_row(self, y):
+        """
+        Return a copy of the line *y*, as a list or an array.
+        """
+        self.check_region(0, y, self.width, 1)
+        start = y * self.width
+        return self.cells[start:start + self.width]
+
+    def set_row(self, y, values):
+        """
+        Set the line *y* to *values*, a sequence of *width* elements.
+        """
+        self.check_region(0, y, self.width, 1)
+        values = self.make_cells(values)
+        if len(values) != self.width:
+            raise ValueError('%s has lines of %d elements, not %d'
+                             % (repr(self), self.width, len(values)))
+        start = y * self.width
+        self.cells[start:start + self.width] = values
+
+    def get_m(self):
+        width = self.width
+        return [list(self.cells[y * width:(y + 1) * width])
+                for y in xrange(self.height)]
+
+    m = property(get_m)
+    """
+    A new list with a list of the elements of each line, so that
+    m[y][x] is the element at (x, y). Changing it does not change the
+    matrix. Building it copies every element, so prefer :attr:`cells`,
+    get() and get_row().
+    """
+
+    def get_region(self, x, y, width, height):
+        """
+        Return a new Matrix with a copy of the *width* x *height*
+        elements whose top left corner is (*x*, *y*).
+        """
+        self.check_region(x, y, width, height)
+        region = Matrix(0, 0, self.typecode, self.default)
+        cells = region.cells
+        for line in xrange(y, y + height):
+            start = line * self.width + x
+            cells.extend(self.cells[start:start + width])
+        region.width, region.height = width, height
+        return region
+
+    def set_region(self, x, y, region):
+        """
+        Copy the elements of *region*, another Matrix, so that its top
+        left corner goes to (*x*, *y*).
+        """
+        self.check_region(x, y, region.width, region.height)
+        cells = self.make_cells(region.cells)
+        for line in xrange(region.height):
+            start = (y + line) * self.width + x
+            region_start = line * region.width
+            self.cells[start:start + region.width] = \
+                cells[region_start:region_start + region.width]
+
+    def fill(self, value, x=0, y=0, width=None, height=None):
+        """
+        Set the elements of the *width* x *height* region whose top left
+        corner is (*x*, *y*) to *value*. By default, the whole Matrix is
+        filled.
+        """
+        if width is None:
+            width = self.width - x
+        if height is None:
+            height = self.height - y
+        self.check_region(x, y, width, height)
+        if width == self.width:
+            self.cells[y * width:(y + height) * width] = \
+                self.make_cells([value]) * (width * height)
+            return
+        line_values = self.make_cells([value]) * width
+        for line in xrange(y, y + height):
+            start = line * self.width + x
+            self.cells[start:start + width] = line_values
+
+    def check_region(self, x, y, width, height):
+        if (x < 0 or y < 0 or width < 0 or height < 0
+            or x + width > self.width or y + height > self.height):
+            raise IndexError('%s has no region of %s x %s at x=%s y=%s'
+                             % (repr(self), width, height, x, y))
+
+    def make_cells(self, values):
+        # Return values in the kind of sequence that holds the cells, or
+        # that many default values if values is a number
+        if isinstance(values, (int, long)):
+            values = [self.default] * values
+        if self.typecode is None:
+            return list(values)
+        elif (isinstance(values, array)
+              and values.typecode == self.typecode):
+            return values
+        else:
+            return array(self.typecode, values)
+
     def resize(self, width=None, height=None):
         new_width = self.width if (width is None) else width
         new_height = self.height if (height is None) else height
-
-        if height is not None:
-            if new_height < self.height:
-                self.m = self.m[:new_height]
-                outdated_lines = new_height
-            elif new_height > self.height:
-                for i in xrange(new_height - self.height):
-                    self.m.append([None] * new_width)
-                outdated_lines = self.height
+        if new_width == self.width:
+            # The lines stay in place, only the ones at the end change
+            size = new_width * new_height
+            if size < len(self.cells):
+                del self.cells[size:]
             else:
-                outdated_lines = self.height
-            self.height = new_height
+                self.cells.extend(self.make_cells(size - len(self.cells)))
         else:
-            outdated_lines = self.height
-
-        if width is not None:
-            if new_width < self.width:
-                for i in xrange(outdated_lines):
-                    self.m[i] = self.m[i][:width]
-            elif new_width > self.width:
-                for i in xrange(outdated_lines):
-                    self.m[i].extend([None] * (new_width - self.width))
-            self.width = new_width
+            cells = self.make_cells(new_width * new_height)
+            kept_width = min(self.width, new_width)
+            for y in xrange(min(self.height, new_height)):
+                start = y * self.width
+                cells[y * new_width:y * new_width + kept_width] = \
+                    self.cells[start:start + kept_width]
+            self.cells = cells
+        self.width = new_width
+        self.height = new_height
 
 
 def inverse(direction):
     """
     Return the opposite of a direction. UP <-> DOWN and LEFT <-> RIGHT.
     """
-    return {UP: DOWN, DOWN: UP, LEFT: RIGHT, RIGHT: LEFT}[direction]
+    return INVERSE_DIRECTIONS[direction]
+
+
+INVERSE_DIRECTIONS = {UP: DOWN, DOWN: UP, LEFT: RIGHT, RIGHT: LEFT}
 
 
 def determine_facing(new_pos, old_pos):
@@ -201,18 +373,10 @@ def determine_facing(new_pos, old_pos):
     Returns the direction that has to be followed to get from *old_pos*
     to *new_pos*. Returns None if they are not adjacent.
     """
+    return FACINGS.get((new_pos.x - old_pos.x, new_pos.y - old_pos.y))
 
-    delta = new_pos - old_pos
-    if delta == Position(-1, 0):
-        return LEFT
-    elif delta == Position(1, 0):
-        return RIGHT
-    elif delta == Position(0, -1):
-        return UP
-    elif delta == Position(0, 1):
-        return DOWN
-    else:
-        return None
+
+FACINGS = {(-1, 0): LEFT, (1, 0): RIGHT, (0, -1): UP, (0, 1): DOWN}
 
 
 def check_direction(key):
@@ -4,6 +4,8 @@ that can be blitted to the same way, but scales everything blitted
 onto it to the scale configured in graphic_config.
 """
 
+import weakref
+
 import pygame
 
 
@@ -20,24 +22,295 @@ class ScaledScreen(pygame.Surface):
 
     This is especially important to implement the draw() methods of
     Contexts that display objects on the screen.
+
+    If *dirty_rects* is True, flip() will only scale and send to the
+    display the regions reported through mark_dirty() and
+    mark_all_dirty() since the last flip.
     """
 
+    # Above this fraction of the screen area, dirty regions are presented
+    # with a single full screen flip
+    FULL_FLIP_THRESHOLD = 0.5
+
     def __init__(self, width_and_height, real_screen, scale=1, flags=0,
-                 depth=0):
+                 depth=0, dirty_rects=False):
         pygame.Surface.__init__(self, width_and_height, flags, depth)
         self.real_screen = real_screen
+        self.scale = scale
         real_width = int(width_and_height[0] * scale)
         real_height = int(width_and_height[1] * scale)
         self.real_width_and_height = (real_width, real_height)
+        self.dirty_rects = dirty_rects
+        self.dirty = []
+        self.all_dirty = True
+
+    def mark_dirty(self, rect):
+        """
+        Report that the pixels in *rect* may have changed since the last
+        flip. Does nothing unless the screen tracks dirty regions.
+        """
+        if self.dirty_rects and not self.all_dirty:
+            self.dirty.append(pygame.Rect(rect))
+
+    def mark_all_dirty(self):
+        """
+        Report that any pixel on the screen may have changed since the
+        last flip.
+        """
+        self.all_dirty = True
 
     def flip(self):
         """
         Flips the ScaledScreen. This flips the Pygame display.
         """
+        if not self.dirty_rects or self.all_dirty:
+            self.flip_all()
+        else:
+            self.flip_dirty()
+        self.dirty = []
+        self.all_dirty = False
+
+    def flip_all(self):
         pygame.transform.scale(self, self.real_width_and_height,
                                self.real_screen)
         pygame.display.flip()
 
+    def flip_dirty(self):
+        rects = self.merge_dirty()
+        if rects is None:
+            self.flip_all()
+            return
+
+        real_rects = []
+        for rect in rects:
+            left = int(rect.left * self.scale)
+            top = int(rect.top * self.scale)
+            real_rect = pygame.Rect(left, top,
+                                    int(rect.right * self.scale) - left,
+                                    int(rect.bottom * self.scale) - top)
+            scaled = pygame.transform.scale(self.subsurface(rect),
+                                            real_rect.size)
+            self.real_screen.blit(scaled, real_rect)
+            real_rects.append(real_rect)
+        if real_rects:
+            pygame.display.update(real_rects)
+
+    def start_recording(self):
+        """
+        Start recording the blit() and fill() calls made on the screen,
+        until stop_recording() is called, so that they can be repeated
+        with replay().
+        """
+        operations = []
+        cls = self.__class__
+
+        def blit(source, dest, area=None, special_flags=0):
+            if isinstance(dest, pygame.Rect):
+                dest = pygame.Rect(dest)
+            if isinstance(area, pygame.Rect):
+                area = pygame.Rect(area)
+            operations.append((cls.blit, (source, dest, area,
+                                          special_flags)))
+            return cls.blit(self, source, dest, area, special_flags)
+
+        def fill(color, rect=None, special_flags=0):
+            if isinstance(rect, pygame.Rect):
+                rect = pygame.Rect(rect)
+            operations.append((cls.fill, (color, rect, special_flags)))
+            return cls.fill(self, color, rect, special_flags)
+
+        # Shadow the methods only while recording, so that blitting
+        # costs nothing more the rest of the time
+        self.blit = blit
+        self.fill = fill
+        self.recording = operations
+
+    def stop_recording(self):
+        """
+        Stop recording and return the operations recorded since
+        start_recording().
+        """
+        del self.blit
+        del self.fill
+        operations = self.recording
+        del self.recording
+        return operations
+
+    def replay(self, operations):
+        """
+        Repeat the *operations* returned by stop_recording().
+        """
+        for method, args in operations:
+            method(self, *args)
+
+    def merge_dirty(self):
+        """
+        Return the dirty regions clipped to the screen, with overlapping
+        ones merged, or None if they cover enough of the screen to be
+        better presented at once.
+        """
+        screen_rect = self.get_rect()
+        merged = []
+        for rect in self.dirty:
+            rect = rect.clip(screen_rect)
+            if not rect.width or not rect.height:
+                continue
+            index = rect.collidelist(merged)
+            while index != -1:
+                rect.union_ip(merged.pop(index))
+                index = rect.collidelist(merged)
+            merged.append(rect)
+
+        area = sum([rect.width * rect.height for rect in merged])
+        if area > (screen_rect.width * screen_rect.height
+                   * ScaledScreen.FULL_FLIP_THRESHOLD):
+            return None
+        return merged
+
+
+class PrescaledScreen(ScaledScreen):
+    """
+    A ScaledScreen for integer scales that draws directly onto the
+    Pygame display, so flip() does not have to scale the whole screen.
+
+    The coordinates passed to blit() and fill() are scaled, and each
+    blitted surface is replaced by a scaled copy of it. Copies of the
+    surfaces registered with *librpg.virtualscreen.prescale()* are made
+    once and kept while the surface exists; other surfaces are scaled
+    on every blit.
+
+    Only what is drawn with blit() and fill() reaches the display.
+    """
+
+    def __init__(self, width_and_height, real_screen, scale=1, flags=0,
+                 depth=0, dirty_rects=False):
+        ScaledScreen.__init__(self, width_and_height, real_screen,
+                              int(scale), flags, depth, dirty_rects)
+
+    def blit(self, source, dest, area=None, special_flags=0):
+        source_rect = source.get_rect()
+        if area is None:
+            area = source_rect
+            left, top = dest[0], dest[1]
+        else:
+            area = pygame.Rect(area)
+            clipped = area.clip(source_rect)
+            left = dest[0] + clipped.left - area.left
+            top = dest[1] + clipped.top - area.top
+            area = clipped
+        if not area.width or not area.height:
+            return pygame.Rect(left, top, 0, 0)
+
+        twin = get_scaled_twin(source, self.scale)
+        if twin is None:
+            twin = pygame.transform.scale(source.subsurface(area),
+                                          (area.width * self.scale,
+                                           area.height * self.scale))
+            real_area = None
+        elif area == source_rect:
+            real_area = None
+        else:
+            real_area = self.scale_rect(area)
+        real_rect = self.real_screen.blit(twin, (left * self.scale,
+                                                 top * self.scale),
+                                          real_area, special_flags)
+        return self.unscale_rect(real_rect)
+
+    def fill(self, color, rect=None, special_flags=0):
+        if rect is not None:
+            rect = self.scale_rect(pygame.Rect(rect))
+        real_rect = self.real_screen.fill(color, rect, special_flags)
+        return self.unscale_rect(real_rect)
+
+    def flip_all(self):
+        pygame.display.flip()
+
+    def flip_dirty(self):
+        rects = self.merge_dirty()
+        if rects is None:
+            self.flip_all()
+        elif rects:
+            pygame.display.update([self.scale_rect(rect) for rect in rects])
+
+    def scale_rect(self, rect):
+        scale = self.scale
+        return pygame.Rect(rect.left * scale, rect.top * scale,
+                           rect.width * scale, rect.height * scale)
+
+    def unscale_rect(self, rect):
+        scale = self.scale
+        return pygame.Rect(rect.left / scale, rect.top / scale,
+                           rect.width / scale, rect.height / scale)
+
+
+# Registered static surfaces, mapped to None or to a (scale, twin) tuple
+# with their latest scaled copy
+static_surfaces = weakref.WeakKeyDictionary()
+
+
+def prescale(surface, lazy=False):
+    """
+    Register *surface* as static, that is, its pixels will not be changed
+    anymore. A PrescaledScreen will then keep a scaled copy of it instead
+    of scaling it on every blit.
+
+    The copy is made right away if the screen is a PrescaledScreen,
+    unless *lazy* is True, in which case it is only made when the
+    surface is first blitted. Registering a surface again discards its
+    previous copy, so a registered surface that is changed after all
+    should be registered again, or unregistered with unprescale().
+    """
+    screen = get_screen()
+    if not lazy and isinstance(screen, PrescaledScreen):
+        static_surfaces[surface] = (screen.scale,
+                                    scale_surface(surface, screen.scale))
+    else:
+        static_surfaces[surface] = None
+
+
+def unprescale(surface):
+    """
+    Unregister *surface*, discarding its scaled copy, if any.
+    """
+    static_surfaces.pop(surface, None)
+
+
+def get_scaled_twin(surface, scale):
+    """
+    Return the copy of the static *surface* scaled by *scale*, or None
+    if *surface* was not registered with prescale().
+    """
+    try:
+        entry = static_surfaces[surface]
+    except KeyError:
+        return None
+    if entry is None or entry[0] != scale:
+        entry = (scale, scale_surface(surface, scale))
+        static_surfaces[surface] = entry
+    return entry[1]
+
+
+def surface_memory(surface):
+    """
+    Return how many bytes *surface* and its prescaled copy, if one was
+    made, take.
+    """
+    memory = surface.get_pitch() * surface.get_height()
+    entry = static_surfaces.get(surface)
+    if entry is not None:
+        twin = entry[1]
+        memory += twin.get_pitch() * twin.get_height()
+    return memory
+
+
+def scale_surface(surface, scale):
+    width, height = surface.get_size()
+    twin = pygame.transform.scale(surface, (width * scale, height * scale))
+    colorkey = surface.get_colorkey()
+    if colorkey is not None:
+        twin.set_colorkey(colorkey, pygame.RLEACCEL)
+    return twin
+
 
 class VirtualScreen(object):
 
@@ -45,25 +318,37 @@ class VirtualScreen(object):
         self.real_screen = None
         self.screen = None
 
-    def init_real_screen(self, real_screen_dimensions, display_mode):
+    def init_real_screen(self, real_screen_dimensions, display_mode,
+                         display_depth=0):
         self.real_screen = pygame.display.set_mode(real_screen_dimensions,
-                                                   display_mode)
+                                                   display_mode,
+                                                   display_depth)
 
-    def init_virtual_screen(self, screen_dimensions, scale):
-        self.screen = ScaledScreen(screen_dimensions, self.real_screen, scale,
-                                   depth=32)
+    def init_virtual_screen(self, screen_dimensions, scale,
+                            dirty_rects=False, prescale=False):
+        if prescale and scale == int(scale):
+            screen_class = PrescaledScreen
+        else:
+            screen_class = ScaledScreen
+        self.screen = screen_class(screen_dimensions, self.real_screen, scale,
+                                   depth=32, dirty_rects=dirty_rects)
 
     def create_screen(self, real_screen_dimensions, display_mode,
-                      screen_dimensions, scale):
-        self.init_real_screen(real_screen_dimensions, display_mode)
-        self.init_virtual_screen(screen_dimensions, scale)
+                      screen_dimensions, scale, dirty_rects=False,
+                      prescale=False, display_depth=0):
+        self.init_real_screen(real_screen_dimensions, display_mode,
+                              display_depth)
+        self.init_virtual_screen(screen_dimensions, scale, dirty_rects,
+                                 prescale)
 
 screen_container = VirtualScreen()
 
 
-def init(real_screen_dimensions, display_mode, screen_dimensions, scale):
+def init(real_screen_dimensions, display_mode, screen_dimensions, scale,
+         dirty_rects=False, prescale=False, display_depth=0):
     screen_container.create_screen(real_screen_dimensions, display_mode,
-                                   screen_dimensions, scale)
+                                   screen_dimensions, scale, dirty_rects,
+                                   prescale, display_depth)
 
 
 def get_screen():
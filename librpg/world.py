@@ -100,6 +100,23 @@ class BaseWorld(object):
         """
         raise NotImplementedError('BaseWorld.gameloop() is abstract')
 
+    def simulate(self, ticks=None, until=None):
+        """
+        Run gameloop() as a simulation, updating the maps as fast as
+        possible without drawing them, until *ticks* updates were run or
+        the *until* callable returns True.
+
+        Return the Simulation, which tells how many updates were run
+        and how fast.
+        """
+        context_stack = get_context_stack()
+        context_stack.start_simulation(ticks, until)
+        try:
+            self.gameloop()
+        finally:
+            simulation = context_stack.stop_simulation()
+        return simulation
+
     def custom_gameover(self):
         """
         *Virtual.*
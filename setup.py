@@ -27,6 +27,8 @@ def get_data_files(test, tools):
         data.append(join('tools', 'charset', '*.scm'))
         data.append(join('tools', 'charset', '*.py'))
         data.append(join('tools', 'tileset', '*.py'))
+        data.append(join('tools', 'benchmark', '*.py'))
+        data.append(join('tools', 'map', '*.py'))
     
     return data
 